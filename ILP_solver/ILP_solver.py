@@ -1,11 +1,93 @@
 from gurobipy import *
 import networkx
-from graph_tools.visualization import *
-import time as python_time
+from graph_tools.visualization import print_edges_in_graph
+from graph_tools.feasibility import screen_connectivity_demands
+from graph_tools.active_subgraph import ActiveSubgraphIndex
+from .metrics import SolveMetrics
+from .heuristic import shared_path_warm_start
 from collections import defaultdict
 
 
-def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False):
+def has_solution(model):
+	"""
+	Returns whether an optimized model holds a solution to recover: an optimal one, or the incumbent of a solve
+	stopped by its time limit or by a callback.
+	"""
+	return model.status == GRB.status.OPTIMAL or (
+		model.status in (GRB.status.TIME_LIMIT, GRB.status.INTERRUPTED) and model.SolCount > 0)
+
+
+def set_warm_start(edge_variables, edges):
+	"""
+	Sets the start value of every edge variable to 1 if its edge is among the given edges, 0 otherwise.
+	"""
+	chosen_edges = set(edges)
+	for edge, variable in edge_variables.iteritems():
+		variable.Start = 1 if edge in chosen_edges else 0
+
+
+def node_exists(existence_for_node_condition, node, condition):
+	"""
+	Returns whether the node exists at the condition, where an existence dictionary of None means every node
+	always exists.
+	"""
+	return existence_for_node_condition is None or existence_for_node_condition[node, condition]
+
+
+def is_edge_active(existence_for_node_condition, existence_for_edge_condition, u, v, condition):
+	"""
+	Returns whether edge u -> v can be used at the condition: both endpoints exist, and the edge itself exists
+	according to the (sparse) edge existence dictionary, if one is given.
+	"""
+	return bool(node_exists(existence_for_node_condition, u, condition) and
+				node_exists(existence_for_node_condition, v, condition) and
+				(existence_for_edge_condition is None or existence_for_edge_condition.get((u, v, condition), 0)))
+
+
+class ReducedEdgeExistence(object):
+	"""
+	Edge existence of the DCSP instance reduced from a DCSN instance, computed on demand from the original
+	edge existence so that it is never copied once per demand. Edges added by the reduction always exist (their
+	buffer nodes only exist at their own condition).
+	"""
+
+	def __init__(self, graph, existence_for_edge_condition, original_condition_for_new_condition):
+		self.graph = graph
+		self.existence_for_edge_condition = existence_for_edge_condition
+		self.original_condition_for_new_condition = original_condition_for_new_condition
+
+	def get(self, key, default=0):
+		u, v, new_condition = key
+		if not self.graph.has_edge(u, v):
+			return 1
+		original_condition = self.original_condition_for_new_condition[new_condition]
+		return self.existence_for_edge_condition.get((u, v, original_condition), default)
+
+
+def shared_path_start(graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition,
+					  metrics, active_subgraph_index=None):
+	"""
+	Returns the edges of the shared path heuristic's subgraph, to warm start a solver, timed as the heuristic phase.
+	"""
+	with metrics.phase('heuristic'):
+		return shared_path_warm_start(graph, existence_for_node_condition, connectivity_demands,
+									  existence_for_edge_condition, active_subgraph_index=active_subgraph_index)
+
+
+def build_active_subgraph_index(graph, existence_for_node_condition, connectivity_demands,
+								existence_for_edge_condition, metrics):
+	"""
+	Returns an ActiveSubgraphIndex of the instance covering the demanded conditions, timed as the pruning phase.
+	"""
+	with metrics.phase('pruning'):
+		conditions = set(condition for source, target, condition in connectivity_demands)
+		return ActiveSubgraphIndex(graph, existence_for_node_condition, existence_for_edge_condition, conditions)
+
+
+def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False,
+						check_feasibility=True, drop_infeasible_demands=False, quiet=False, return_metrics=False,
+						metrics=None, time_limit=None, callback=None, warm_start=None, portfolio=None,
+						existence_for_edge_condition=None, threads=None, active_subgraph_index=None):
 	"""
 	Given a CSN problem instance:
 		- A directed graph with attribute 'weight' on all edges
@@ -15,7 +97,43 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 	returns a minimum weight subgraph that satisfies the demands.
 
 	Works by reducing to DCSP .
+
+	If check_feasibility is set, unsatisfiable demands are reported before any model is built; they are then
+	dropped if drop_infeasible_demands is set, otherwise None is returned.
+
+	If quiet is set, nothing is printed (including solver output). If return_metrics is set, returns a pair
+	(subgraph, SolveMetrics) instead; pass an existing SolveMetrics as metrics to record into it.
+
+	If time_limit (in seconds) is set, optimization stops after that long and the best subgraph found so far is
+	returned. A Gurobi callback can be given, which finds the edge variables in model._edge_variables. If
+	warm_start is given (the edges of a feasible subgraph), optimization starts from that solution; if it is
+	'shared_paths', the start is computed by the shared path heuristic (see ILP_solver.heuristic). If threads is
+	set, the optimization library uses at most that many threads.
+
+	If portfolio is set (True, or a list of configuration names from ILP_solver.portfolio), several formulations
+	are raced in separate processes instead and the first to prove optimality wins; see solve_portfolio. Callbacks
+	cannot be given in this mode, as the formulations are solved in other processes.
+
+	For edge-varying instances, existence_for_edge_condition is a sparse dictionary from (u, v, condition) to
+	existence {True, False}, where missing entries do not exist; flow variables are only created for edges that
+	exist at their condition. existence_for_node_condition may then be None, meaning every node always exists.
+
+	The feasibility check and the shared path heuristic query the active subgraphs through active_subgraph_index, an
+	ActiveSubgraphIndex of the instance covering the demanded conditions; one is built if needed and not given, but
+	callers running other stages on the same instance can share theirs.
 	"""
+	if portfolio:
+		if callback is not None:
+			raise ValueError('Portfolio mode takes no callback, as its configurations run in other processes')
+		from .portfolio import solve_portfolio
+		return solve_portfolio(graph, existence_for_node_condition, connectivity_demands,
+							   configurations=None if portfolio is True else portfolio, time_limit=time_limit,
+							   detailed_output=detailed_output, check_feasibility=check_feasibility,
+							   drop_infeasible_demands=drop_infeasible_demands, quiet=quiet,
+							   return_metrics=return_metrics, metrics=metrics, warm_start=warm_start,
+							   existence_for_edge_condition=existence_for_edge_condition, threads=threads,
+							   active_subgraph_index=active_subgraph_index)
+
 
 	def transform_DCSN_to_DCSP(graph, existence_for_node_condition, connectivity_demands, detailed_output=False):
 		"""
@@ -27,12 +145,11 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 		returns a DCSP instance:
 			- A directed graph
 			- An existence dictionary
+			- An edge existence dictionary, or None if edges do not vary
 			- A list of connectivity demands, all at different conditions
 			- A single source node
 			- A single target node
 		"""
-		start_time = time.time()
-
 		# Initialize new graph to original graph
 		new_graph = graph.copy()
 
@@ -73,7 +190,8 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 		for new_condition in new_conditions:
 			original_condition = original_condition_for_new_condition[new_condition]
 			for node in graph.nodes_iter():
-				new_existence_for_node_condition[node, new_condition] = existence_for_node_condition[node, original_condition]
+				new_existence_for_node_condition[node, new_condition] = int(
+					node_exists(existence_for_node_condition, node, original_condition))
 		# Universal source and target exist at all conditions
 		for new_condition in new_conditions:
 			new_existence_for_node_condition[source, new_condition] = 1
@@ -82,23 +200,26 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 		for buffer_node, new_condition in buffer_nodes_and_conditions:
 			new_existence_for_node_condition[buffer_node, new_condition] = 1
 
+		# Map conditions for edges in original graph, if edges vary
+		new_existence_for_edge_condition = None
+		if existence_for_edge_condition is not None:
+			new_existence_for_edge_condition = ReducedEdgeExistence(graph, existence_for_edge_condition,
+																	original_condition_for_new_condition)
+
 		# Create new connectivity demands
 		new_connectivity_demands = [(source, target, new_condition) for new_condition in new_conditions]
 
 		# Print information
-		print('-----------------------------------------------------------------------')
-		print('Reduced DCSN instance to DCSP instance.')
-		if detailed_output:
-			print('Buffer nodes added:')
-			for buffer_node, new_condition in buffer_nodes_and_conditions:
-				print(str(buffer_node) + ' at condition ' + str(new_condition))
+		if not quiet:
+			print('-----------------------------------------------------------------------')
+			print('Reduced DCSN instance to DCSP instance.')
+			if detailed_output:
+				print('Buffer nodes added:')
+				for buffer_node, new_condition in buffer_nodes_and_conditions:
+					print(str(buffer_node) + ' at condition ' + str(new_condition))
 
-		end_time = time.time()
-		days, hours, minutes, seconds = execution_time(start_time, end_time)
-		print('DCSN -> DCSP instance transformation took %s days, %s hours, %s minutes, %s seconds' % (
-		days, hours, minutes, seconds))
-
-		return new_graph, new_existence_for_node_condition, new_connectivity_demands, source, target
+		return new_graph, new_existence_for_node_condition, new_existence_for_edge_condition, \
+			new_connectivity_demands, source, target
 
 	def recover_DCSN_solution_from_DCSP_solution(subgraph, source, target, detailed_output=False):
 		"""
@@ -109,7 +230,6 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 
 		returns the subgraph that is the solution to the original DCSN instance.
 		"""
-		start_time = time.time()
 
 		# Clean up universal source and target, and buffers
 		subgraph.remove_nodes_from([source_buffer for source_buffer in subgraph.successors(source)])
@@ -117,33 +237,70 @@ def solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demand
 		subgraph.remove_nodes_from([source, target])
 
 		# Print information
-		print('-----------------------------------------------------------------------')
-		print('Recovered DCSN solution from DCSP solution.')
-		if detailed_output:
-			print('Edges in minimal subgraph:')
-			print_edges_in_graph(subgraph)
-
-		end_time = time.time()
-		days, hours, minutes, seconds = execution_time(start_time, end_time)
-		print('DCSP -> DCSN solution recovery took %s days, %s hours, %s minutes, %s seconds' % (
-		days, hours, minutes, seconds))
+		if not quiet:
+			print('-----------------------------------------------------------------------')
+			print('Recovered DCSN solution from DCSP solution.')
+			if detailed_output:
+				print('Edges in minimal subgraph:')
+				print_edges_in_graph(subgraph)
 
 		return subgraph
 
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+
+	if active_subgraph_index is None and (check_feasibility or warm_start == 'shared_paths'):
+		active_subgraph_index = build_active_subgraph_index(graph, existence_for_node_condition, connectivity_demands,
+															existence_for_edge_condition, metrics)
+
+	# Screen out unsatisfiable demands before building any model
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition, active_subgraph_index)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+		if not connectivity_demands:
+			return solution(networkx.DiGraph())  # Nothing left to connect
+
+	if warm_start == 'shared_paths':
+		warm_start = shared_path_start(graph, existence_for_node_condition, connectivity_demands,
+									   existence_for_edge_condition, metrics, active_subgraph_index)
+
 	# Reduce to DCSP
-	simple_graph, simple_existence_for_node_condition, simple_connectivity_demands, source, target = transform_DCSN_to_DCSP(
-		graph, existence_for_node_condition, connectivity_demands, detailed_output)
+	with metrics.phase('reduction'):
+		simple_graph, simple_existence_for_node_condition, simple_existence_for_edge_condition, \
+			simple_connectivity_demands, source, target = transform_DCSN_to_DCSP(
+				graph, existence_for_node_condition, connectivity_demands, detailed_output)
+		# Every edge through the universal source, target and buffer nodes is used by its demand
+		auxiliary_edges = [(u, v) for u, v in simple_graph.edges_iter() if not graph.has_edge(u, v)]
 
 	simple_subgraph = solve_DCSP_instance(simple_graph, simple_existence_for_node_condition, simple_connectivity_demands,
-										  detailed_output)
+										  detailed_output, check_feasibility=False, quiet=quiet, metrics=metrics,
+										  time_limit=time_limit, callback=callback,
+										  warm_start=None if warm_start is None else list(warm_start) + auxiliary_edges,
+										  existence_for_edge_condition=simple_existence_for_edge_condition,
+										  threads=threads)
 
+	subgraph = None  # No solution
 	if simple_subgraph is not None:
-		return recover_DCSN_solution_from_DCSP_solution(simple_subgraph, source, target, detailed_output)
-	else:
-		return None  # No solution
+		with metrics.phase('recovery'):
+			subgraph = recover_DCSN_solution_from_DCSP_solution(simple_subgraph, source, target, detailed_output)
+
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+		metrics.print_summary()
 
+	return solution(subgraph)
 
-def solve_DCSP_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False):
+
+def solve_DCSP_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False,
+						check_feasibility=True, drop_infeasible_demands=False, quiet=False, return_metrics=False,
+						metrics=None, time_limit=None, callback=None, warm_start=None, existence_for_edge_condition=None,
+						threads=None):
 	"""
 	Given a DCSP problem instance:
 		- A directed graph with attribute 'weight' on all edges
@@ -152,92 +309,125 @@ def solve_DCSP_instance(graph, existence_for_node_condition, connectivity_demand
 			ASSUMPTION: each demand is at a different condition
 
 	returns a minimum weight subgraph that satisfies the demands.
+
+	See solve_DCSN_instance for check_feasibility, drop_infeasible_demands, quiet, return_metrics, metrics,
+	time_limit, callback, warm_start, existence_for_edge_condition and threads.
 	"""
-	print 'Attempting to solve instance'
-	start_time = python_time.time()
-
-	# MODEL SETUP
-	# Infer a list of conditions
-	conditions = list(set([condition for source, target, condition in connectivity_demands]))
-
-	# Sources get +1 sourceflow, targets get -1, other nodes 0
-	sourceflow = {(v, c): 0 for v in graph.nodes_iter() for c in conditions}
-	for source, target, condition in connectivity_demands:
-		sourceflow[source, condition] = 1
-		sourceflow[target, condition] = -1
-
-	# Create empty optimization model
-	model = Model('Directed_Condition_Shortest_Path')
-
-	print 'Attempting to solve instance'
-	# Create variables d_{uvt}
-	edge_condition_variables = {}
-	for c in conditions:
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+
+	with metrics.phase('model_build'):
+		# MODEL SETUP
+		# Infer a list of conditions
+		conditions = list(set([condition for source, target, condition in connectivity_demands]))
+
+		# Sources get +1 sourceflow, targets get -1, other nodes 0
+		sourceflow = {(v, c): 0 for v in graph.nodes_iter() for c in conditions}
+		for source, target, condition in connectivity_demands:
+			sourceflow[source, condition] = 1
+			sourceflow[target, condition] = -1
+
+		# Create empty optimization model
+		model = Model('Directed_Condition_Shortest_Path')
+		if quiet:
+			model.params.OutputFlag = 0
+		if threads is not None:
+			model.params.Threads = threads
+		if time_limit is not None:
+			model.params.TimeLimit = time_limit
+
+		# Create variables d_{uvt}, only for edges active at condition t (can only route flow through active nodes
+		# and edges)
+		edge_condition_variables = {}
+		for c in conditions:
+			for u, v in graph.edges_iter():
+				if is_edge_active(existence_for_node_condition, existence_for_edge_condition, u, v, c):
+					edge_condition_variables[u, v, c] = model.addVar(vtype=GRB.BINARY,
+																	 name='edge_condition_%s_%s_%s' % (u, v, c))
+
+		# Create variables d_{uv}
+		edge_variables = {}
 		for u, v in graph.edges_iter():
-			edge_condition_variables[u, v, c] = model.addVar(vtype=GRB.BINARY, name='edge_condition_%s_%s_%s' % (u, v, c))
+			edge_variables[u, v] = model.addVar(vtype=GRB.BINARY, name='edge_%s_%s' % (u, v))
 
-	# Create variables d_{uv}
-	edge_variables = {}
-	for u, v in graph.edges_iter():
-		edge_variables[u, v] = model.addVar(vtype=GRB.BINARY, name='edge_%s_%s' % (u, v))
+		model.update()
 
-	model.update()
-
-	# CONSTRAINTS
-	# Edge decision constraints (an edge is chosen if it is chosen at any condition)
-	for c in conditions:
-		for u, v in graph.edges_iter():
+		# CONSTRAINTS
+		# Edge decision constraints (an edge is chosen if it is chosen at any condition)
+		for u, v, c in edge_condition_variables:
 			model.addConstr(edge_variables[u, v] >= edge_condition_variables[u, v, c])
 
-	# Existence constraints (can only route flow through active nodes)
-	for c in conditions:
-		for u, v in graph.edges_iter():
-			model.addConstr(edge_condition_variables[u, v, c] <= existence_for_node_condition[u, c])
-			model.addConstr(edge_condition_variables[u, v, c] <= existence_for_node_condition[v, c])
+		# Flow conservation constraints
+		for c in conditions:
+			for v in graph.nodes_iter():
+				model.addConstr(
+					quicksum(edge_condition_variables[u, v, c] for u in graph.predecessors_iter(v)
+							 if (u, v, c) in edge_condition_variables) + sourceflow[v, c] ==
+					quicksum(edge_condition_variables[v, w, c] for w in graph.successors_iter(v)
+							 if (v, w, c) in edge_condition_variables)
+				)
 
-	# Flow conservation constraints
-	for c in conditions:
-		for v in graph.nodes_iter():
-			model.addConstr(
-				quicksum(edge_condition_variables[u, v, c] for u in graph.predecessors_iter(v)) + sourceflow[v, c] ==
-				quicksum(edge_condition_variables[v, w, c] for w in graph.successors_iter(v))
-			)
+		# OBJECTIVE
+		# Minimize total subgraph weight
+		objective_expression = quicksum(edge_variables[u, v] * graph[u][v]['weight'] for u, v in graph.edges_iter())
+		model.setObjective(objective_expression, GRB.MINIMIZE)
 
-	print 'Attempting to solve instance'
+		# Start from the given subgraph, if any
+		if warm_start is not None:
+			set_warm_start(edge_variables, warm_start)
 
-	# OBJECTIVE
-	# Minimize total subgraph weight
-	objective_expression = quicksum(edge_variables[u, v] * graph[u][v]['weight'] for u, v in graph.edges_iter())
-	model.setObjective(objective_expression, GRB.MINIMIZE)
+		metrics.record_model(model)
 
 	# SOLVE AND RECOVER SOLUTION
-	print('-----------------------------------------------------------------------')
-	model.optimize()
-
-	# Recover minimal subgraph
-	subgraph = networkx.DiGraph()
-	if model.status == GRB.status.OPTIMAL:
-		value_for_edge = model.getAttr('x', edge_variables)
-		for u, v in graph.edges_iter():
-			if value_for_edge[u, v] > 0:
-				subgraph.add_edge(u, v, weight=graph[u][v]['weight'])
-
-		# Print solution
+	if not quiet:
 		print('-----------------------------------------------------------------------')
-		print('Solved DCSP instance.')
-		if detailed_output:
-			print('Edges in minimal subgraph:')
-			print_edges_in_graph(subgraph)
+	model._edge_variables = edge_variables
+	with metrics.phase('optimize'):
+		model.optimize(callback)
+	metrics.record_optimization(model)
 
-	end_time = python_time.time()
-	days, hours, minutes, seconds = execution_time(start_time, end_time)
-	print('DCSP solving took %s days, %s hours, %s minutes, %s seconds' % (days, hours, minutes, seconds))
+	# Recover minimal subgraph
+	with metrics.phase('recovery'):
+		subgraph = networkx.DiGraph()
+		if has_solution(model):
+			value_for_edge = model.getAttr('x', edge_variables)
+			for u, v in graph.edges_iter():
+				if value_for_edge[u, v] > 0.5:
+					subgraph.add_edge(u, v, weight=graph[u][v]['weight'])
+
+			# Print solution
+			if not quiet:
+				print('-----------------------------------------------------------------------')
+				print('Solved DCSP instance.')
+				if detailed_output:
+					print('Edges in minimal subgraph:')
+					print_edges_in_graph(subgraph)
+
+	if not quiet:
+		solve_phases = ['model_build', 'optimize', 'recovery']
+		print('DCSP solving took %.3f seconds (%.3f CPU seconds)' % (
+			sum(metrics.wall_time_for_phase[phase] for phase in solve_phases),
+			sum(metrics.cpu_time_for_phase[phase] for phase in solve_phases)))
 
 	# Return solution iff found
-	return subgraph if model.status == GRB.status.OPTIMAL else None
+	return solution(subgraph if has_solution(model) else None)
 
 
-def solve_single_source_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False):
+def solve_single_source_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output=False,
+									  check_feasibility=True, drop_infeasible_demands=False, quiet=False,
+									  return_metrics=False, metrics=None, time_limit=None, callback=None, warm_start=None,
+									  existence_for_edge_condition=None, formulation='standard', flow_cuts=False,
+									  threads=1, active_subgraph_index=None):
 	"""
 	Given a single source DCSN problem instance (ie one source per condition):
 		- A directed graph with attribute 'weight' on all edges
@@ -245,96 +435,192 @@ def solve_single_source_DCSN_instance(graph, existence_for_node_condition, conne
 		- A list of connectivity demands (source, target, condition)
 
 	returns a minimum weight subgraph that satisfies the demands.
-	"""
-	print 'Attempting to solve instance'
-	start_time = python_time.time()
-
-	# MODEL SETUP
-	# Infer a list of conditions
-	conditions = list(set([condition for source, target, condition in connectivity_demands]))
-
-	flow_per_condition = defaultdict(int)
-	for source, target, condition in connectivity_demands:
-		flow_per_condition[condition] += 1
-
-	# Sources get +1 sourceflow, targets get -1, other nodes 0
-	sourceflow = {(v, c): 0 for v in graph.nodes_iter() for c in conditions}
-	for source, target, condition in connectivity_demands:
-		print source, target
-		sourceflow[source, condition] = flow_per_condition[condition]
-		sourceflow[target, condition] = -1
-
-	# Create empty optimization model
-	model = Model('single_source_directed_condition_steiner_network')
-	model.params.Threads = 1
-
-	print 'Attempting to solve instance'
-	# Create variables d_{uvc}
-	edge_condition_variables = {}
-	for c in conditions:
-		for u, v in graph.edges_iter():
-			edge_condition_variables[u, v, c] = model.addVar(vtype=GRB.INTEGER, lb=0, ub=flow_per_condition[c],
-														name='edge_time_%s_%s_%s' % (u, v, c))
-
-	# Create variables d_{uv}
-	edge_variables = {}
-	for u, v in graph.edges_iter():
-		edge_variables[u, v] = model.addVar(vtype=GRB.BINARY, name='edge_%s_%s' % (u, v))
-
-	model.update()
-
-	# CONSTRAINTS
-	# Edge decision constraints (an edge is chosen if it is chosen at any time)
-	for c in conditions:
-		for u, v in graph.edges_iter():
-			model.addConstr(edge_variables[u, v] >= (
-					edge_condition_variables[u, v, c] / (max(flow_per_condition.items(), key=lambda k: k[1])[1])))
-
-	# Existence constraints (can only route flow through active nodes)
-	for c in conditions:
-		for u, v in graph.edges_iter():
-			model.addConstr(edge_condition_variables[u, v, c] <= flow_per_condition[c] * existence_for_node_condition[u, c])
-			model.addConstr(edge_condition_variables[u, v, c] <= flow_per_condition[c] * existence_for_node_condition[v, c])
 
-	# Flow conservation constraints
-	for c in conditions:
-		for v in graph.nodes_iter():
-			model.addConstr(
-				quicksum(edge_condition_variables[u, v, c] for u in graph.predecessors_iter(v)) + sourceflow[v, c] ==
-				quicksum(edge_condition_variables[v, w, c] for w in graph.successors_iter(v))
-			)
-			pass
+	The formulation is one of:
+		- 'standard': integer flow per (edge, condition), linked to the edge decision by dividing by the largest
+		  flow over all conditions
+		- 'tight': flow variables only on edges active at each condition, each with a binary usage variable and
+		  capacity equal to the flow of its condition; if flow_cuts is set, cut inequalities forcing used edges
+		  into every target, out of every source, and into the tail of every used edge are added as well
 
-	print 'Attempting to solve instance'
+	The LP relaxation of 'tight' is only stronger than that of 'standard' when conditions have different flows (ie
+	numbers of demands): when every condition has the same flow, the two relaxations are the same, and only the
+	flow cuts tighten it.
 
-	# OBJECTIVE
-	# Minimize total subgraph weight
-	objective_expression = quicksum(edge_variables[u, v] * graph[u][v]['weight'] for u, v in graph.edges_iter())
-	model.setObjective(objective_expression, GRB.MINIMIZE)
+	See solve_DCSN_instance for check_feasibility, drop_infeasible_demands, quiet, return_metrics, metrics,
+	time_limit, callback, warm_start, existence_for_edge_condition, threads (by default, a single thread) and
+	active_subgraph_index.
+	"""
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+
+	if active_subgraph_index is None and (check_feasibility or warm_start == 'shared_paths'):
+		active_subgraph_index = build_active_subgraph_index(graph, existence_for_node_condition, connectivity_demands,
+															existence_for_edge_condition, metrics)
+
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition, active_subgraph_index)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+
+	if warm_start == 'shared_paths':
+		warm_start = shared_path_start(graph, existence_for_node_condition, connectivity_demands,
+									   existence_for_edge_condition, metrics, active_subgraph_index)
+
+	with metrics.phase('model_build'):
+		# MODEL SETUP
+		# Infer a list of conditions
+		conditions = list(set([condition for source, target, condition in connectivity_demands]))
+
+		flow_per_condition = defaultdict(int)
+		for source, target, condition in connectivity_demands:
+			flow_per_condition[condition] += 1
+
+		# Sources get +1 sourceflow, targets get -1, other nodes 0
+		sourceflow = {(v, c): 0 for v in graph.nodes_iter() for c in conditions}
+		for source, target, condition in connectivity_demands:
+			sourceflow[source, condition] = flow_per_condition[condition]
+			sourceflow[target, condition] = -1
+
+		# Create empty optimization model
+		model = Model('single_source_directed_condition_steiner_network')
+		if threads is not None:
+			model.params.Threads = threads
+		if quiet:
+			model.params.OutputFlag = 0
+		if time_limit is not None:
+			model.params.TimeLimit = time_limit
+
+		if formulation == 'standard':
+			# Create variables d_{uvc}, only for edges active at c (this replaces the existence constraints)
+			edge_condition_variables = {}
+			for c in conditions:
+				for u, v in graph.edges_iter():
+					if is_edge_active(existence_for_node_condition, existence_for_edge_condition, u, v, c):
+						edge_condition_variables[u, v, c] = model.addVar(vtype=GRB.INTEGER, lb=0,
+																		 ub=flow_per_condition[c],
+																		 name='edge_time_%s_%s_%s' % (u, v, c))
+
+			# Create variables d_{uv}
+			edge_variables = {}
+			for u, v in graph.edges_iter():
+				edge_variables[u, v] = model.addVar(vtype=GRB.BINARY, name='edge_%s_%s' % (u, v))
+
+			model.update()
+
+			# CONSTRAINTS
+			# Edge decision constraints (an edge is chosen if it is chosen at any time)
+			max_flow = max(flow_per_condition.values()) if flow_per_condition else 1
+			for u, v, c in edge_condition_variables:
+				model.addConstr(edge_variables[u, v] >= edge_condition_variables[u, v, c] * (1.0 / max_flow))
+
+		elif formulation == 'tight':
+			# Create variables d_{uvc} and usage indicators y_{uvc}, only for edges active at c (this replaces the
+			# existence constraints)
+			edge_condition_variables = {}
+			edge_condition_usage_variables = {}
+			for c in conditions:
+				for u, v in graph.edges_iter():
+					if is_edge_active(existence_for_node_condition, existence_for_edge_condition, u, v, c):
+						edge_condition_variables[u, v, c] = model.addVar(vtype=GRB.INTEGER, lb=0,
+																		 ub=flow_per_condition[c],
+																		 name='edge_time_%s_%s_%s' % (u, v, c))
+						edge_condition_usage_variables[u, v, c] = model.addVar(vtype=GRB.BINARY,
+																			   name='edge_used_%s_%s_%s' % (u, v, c))
+
+			# Create variables d_{uv}
+			edge_variables = {}
+			for u, v in graph.edges_iter():
+				edge_variables[u, v] = model.addVar(vtype=GRB.BINARY, name='edge_%s_%s' % (u, v))
+
+			model.update()
+
+			# CONSTRAINTS
+			# Capacity constraints (flow at condition c only along edges used at c, at most the flow of c)
+			# Edge decision constraints (an edge is chosen if it is used at any condition)
+			for u, v, c in edge_condition_usage_variables:
+				model.addConstr(edge_condition_variables[u, v, c] <=
+								flow_per_condition[c] * edge_condition_usage_variables[u, v, c])
+				model.addConstr(edge_variables[u, v] >= edge_condition_usage_variables[u, v, c])
+
+			if flow_cuts:
+				# Every target is entered by a used edge, and every source left by one, at the demand's condition
+				for source, target, c in connectivity_demands:
+					if source == target:
+						continue
+					model.addConstr(quicksum(edge_condition_usage_variables[u, target, c]
+											 for u in graph.predecessors_iter(target)
+											 if (u, target, c) in edge_condition_usage_variables) >= 1)
+					model.addConstr(quicksum(edge_condition_usage_variables[source, w, c]
+											 for w in graph.successors_iter(source)
+											 if (source, w, c) in edge_condition_usage_variables) >= 1)
+
+				# An edge out of a node other than the source is only used if an edge into the node is used
+				source_for_condition = {c: source for source, target, c in connectivity_demands}
+				for v, w, c in edge_condition_usage_variables:
+					if v != source_for_condition[c]:
+						model.addConstr(edge_condition_usage_variables[v, w, c] <=
+										quicksum(edge_condition_usage_variables[u, v, c]
+												 for u in graph.predecessors_iter(v)
+												 if (u, v, c) in edge_condition_usage_variables))
+
+		else:
+			raise ValueError('Unknown formulation %s, expected standard or tight' % formulation)
+
+		# Flow conservation constraints
+		for c in conditions:
+			for v in graph.nodes_iter():
+				model.addConstr(
+					quicksum(edge_condition_variables[u, v, c] for u in graph.predecessors_iter(v)
+							 if (u, v, c) in edge_condition_variables) + sourceflow[v, c] ==
+					quicksum(edge_condition_variables[v, w, c] for w in graph.successors_iter(v)
+							 if (v, w, c) in edge_condition_variables)
+				)
+
+		# OBJECTIVE
+		# Minimize total subgraph weight
+		objective_expression = quicksum(edge_variables[u, v] * graph[u][v]['weight'] for u, v in graph.edges_iter())
+		model.setObjective(objective_expression, GRB.MINIMIZE)
+
+		# Start from the given subgraph, if any
+		if warm_start is not None:
+			set_warm_start(edge_variables, warm_start)
+
+		metrics.record_model(model)
 
 	# SOLVE AND RECOVER SOLUTION
-	print('-----------------------------------------------------------------------')
-	model.optimize()
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+	model._edge_variables = edge_variables
+	with metrics.phase('optimize'):
+		model.optimize(callback)
+	metrics.record_optimization(model)
 
 	# Recover minimal subgraph
-	subgraph = networkx.DiGraph()
-	if model.status == GRB.status.OPTIMAL:
-		value_for_edge = model.getAttr('x', edge_variables)
-		for u, v in graph.edges_iter():
-			if value_for_edge[u, v] > 0:
-				subgraph.add_edge(u, v, weight=graph[u][v]['weight'])
-
-		# Print solution
+	with metrics.phase('recovery'):
+		subgraph = networkx.DiGraph()
+		if has_solution(model):
+			value_for_edge = model.getAttr('x', edge_variables)
+			for u, v in graph.edges_iter():
+				if value_for_edge[u, v] > 0.5:
+					subgraph.add_edge(u, v, weight=graph[u][v]['weight'])
+
+			# Print solution
+			if not quiet:
+				print('-----------------------------------------------------------------------')
+				print('Solved single source DCSN instance.')
+				if detailed_output:
+					print('Edges in minimal subgraph:')
+					print_edges_in_graph(subgraph)
+
+	if not quiet:
 		print('-----------------------------------------------------------------------')
-		print('Solved single source DCSN instance.')
-		if detailed_output:
-			print('Edges in minimal subgraph:')
-			print_edges_in_graph(subgraph)
-
-	end_time = python_time.time()
-	days, hours, minutes, seconds = execution_time(start_time, end_time)
-	print('Single source DCSN solving took %s days, %s hours, %s minutes, %s seconds' % (days, hours, minutes, seconds))
+		metrics.print_summary()
 
 	# Return solution iff found
-	return subgraph if model.status == GRB.status.OPTIMAL else None
-
+	return solution(subgraph if has_solution(model) else None)
@@ -0,0 +1,170 @@
+"""
+This file implements checkpointing of long-running solves, and resuming them from a checkpoint.
+
+A checkpoint directory holds:
+	- instance.json.gz: the instance being solved (including edge existence, if edges vary), after infeasible
+	  demands were dropped
+	- checkpoint.json: the solver configuration, the incumbent subgraph's edges and objective, the best bound
+	  and whether the solve finished
+Both files are replaced atomically, so a preempted process always leaves a consistent checkpoint behind.
+"""
+import json
+import os
+import time
+
+import networkx
+from gurobipy import GRB
+
+from .ILP_solver import solve_DCSN_instance, solve_single_source_DCSN_instance
+from graph_tools.feasibility import screen_connectivity_demands
+from graph_tools.instance_io import write_DCSN_instance, read_DCSN_instance, tuples_from_lists
+
+INSTANCE_FILE_NAME = 'instance.json.gz'
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+
+# Map from solver name to solver entry point
+CHECKPOINT_SOLVERS = {
+	'DCSN': solve_DCSN_instance,
+	'single_source': solve_single_source_DCSN_instance,
+}
+
+
+def write_checkpoint(checkpoint_directory, checkpoint):
+	path = os.path.join(checkpoint_directory, CHECKPOINT_FILE_NAME)
+	with open(path + '.tmp', 'w') as checkpoint_file:
+		json.dump(checkpoint, checkpoint_file)
+	os.rename(path + '.tmp', path)
+
+
+def read_checkpoint(checkpoint_directory):
+	with open(os.path.join(checkpoint_directory, CHECKPOINT_FILE_NAME)) as checkpoint_file:
+		checkpoint = json.load(checkpoint_file)
+	if checkpoint['edges'] is not None:
+		checkpoint['edges'] = [tuples_from_lists(edge) for edge in checkpoint['edges']]
+
+	return checkpoint
+
+
+def checkpointing_callback(graph, checkpoint_directory, checkpoint, checkpoint_interval):
+	"""
+	Returns a Gurobi callback that updates the checkpoint with every improving incumbent (restricted to the edges
+	of graph), and with the best bound at most every checkpoint_interval seconds.
+	"""
+	state = {'last_write_time': time.time()}
+
+	def update_bound(bound):
+		if checkpoint['bound'] is None or bound > checkpoint['bound']:
+			checkpoint['bound'] = bound
+
+	def callback(model, where):
+		if where == GRB.Callback.MIPSOL:
+			objective = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+			if checkpoint['objective'] is None or objective < checkpoint['objective']:
+				value_for_edge = model.cbGetSolution(model._edge_variables)
+				checkpoint['edges'] = [[u, v] for (u, v), value in value_for_edge.iteritems()
+									   if value > 0.5 and graph.has_edge(u, v)]
+				checkpoint['objective'] = objective
+			update_bound(model.cbGet(GRB.Callback.MIPSOL_OBJBND))
+			write_checkpoint(checkpoint_directory, checkpoint)
+			state['last_write_time'] = time.time()
+
+		elif where == GRB.Callback.MIP and time.time() - state['last_write_time'] > checkpoint_interval:
+			update_bound(model.cbGet(GRB.Callback.MIP_OBJBND))
+			write_checkpoint(checkpoint_directory, checkpoint)
+			state['last_write_time'] = time.time()
+
+	return callback
+
+
+def run_checkpointed_solve(checkpoint_directory, graph, existence_for_node_condition, connectivity_demands,
+						   existence_for_edge_condition, checkpoint, checkpoint_interval, time_limit, quiet,
+						   return_metrics):
+	solve = CHECKPOINT_SOLVERS[checkpoint['solver']]
+	callback = checkpointing_callback(graph, checkpoint_directory, checkpoint, checkpoint_interval)
+
+	subgraph, metrics = solve(graph, existence_for_node_condition, connectivity_demands, check_feasibility=False,
+							  quiet=quiet, return_metrics=True, time_limit=time_limit, callback=callback,
+							  warm_start=checkpoint['edges'],
+							  existence_for_edge_condition=existence_for_edge_condition, **checkpoint['options'])
+
+	# Record the final state; the solve is finished unless it was stopped early
+	if subgraph is not None:
+		checkpoint['edges'] = [[u, v] for u, v in subgraph.edges_iter()]
+		checkpoint['objective'] = metrics.objective
+	if metrics.bound is not None and (checkpoint['bound'] is None or metrics.bound > checkpoint['bound']):
+		checkpoint['bound'] = metrics.bound
+	checkpoint['finished'] = metrics.status not in (GRB.status.TIME_LIMIT, GRB.status.INTERRUPTED)
+	write_checkpoint(checkpoint_directory, checkpoint)
+
+	return (subgraph, metrics) if return_metrics else subgraph
+
+
+def solve_with_checkpoints(graph, existence_for_node_condition, connectivity_demands, checkpoint_directory,
+						   solver='DCSN', checkpoint_interval=60, time_limit=None, drop_infeasible_demands=False,
+						   quiet=False, return_metrics=False, existence_for_edge_condition=None, **options):
+	"""
+	Given a DCSN problem instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}, or None if every node always exists
+		- A list of connectivity demands (source, target, condition)
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}
+
+	solves it with the named solver of CHECKPOINT_SOLVERS (and any extra keyword options of that solver), saving
+	the instance to checkpoint_directory first and then every improving incumbent, plus the best bound at most
+	every checkpoint_interval seconds. If the process is stopped, resume_from_checkpoint continues the solve.
+
+	See solve_DCSN_instance for time_limit, drop_infeasible_demands, quiet, return_metrics and
+	existence_for_edge_condition. The extra options must be JSON-serializable, as they are saved in the checkpoint.
+	"""
+	if solver not in CHECKPOINT_SOLVERS:
+		raise ValueError('Unknown solver %s, expected one of %s' % (solver, ', '.join(sorted(CHECKPOINT_SOLVERS))))
+
+	connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition, connectivity_demands,
+													   drop_infeasible_demands, quiet, existence_for_edge_condition)
+	if connectivity_demands is None:
+		return (None, None) if return_metrics else None  # No solution
+
+	if not os.path.isdir(checkpoint_directory):
+		os.makedirs(checkpoint_directory)
+	instance_path = os.path.join(checkpoint_directory, INSTANCE_FILE_NAME)
+	write_DCSN_instance(instance_path + '.tmp.gz', graph, existence_for_node_condition, connectivity_demands,
+						existence_for_edge_condition)
+	os.rename(instance_path + '.tmp.gz', instance_path)
+
+	checkpoint = {'solver': solver, 'options': options, 'edges': None, 'objective': None, 'bound': None,
+				  'finished': False}
+	write_checkpoint(checkpoint_directory, checkpoint)
+
+	return run_checkpointed_solve(checkpoint_directory, graph, existence_for_node_condition, connectivity_demands,
+								  existence_for_edge_condition, checkpoint, checkpoint_interval, time_limit, quiet,
+								  return_metrics)
+
+
+def resume_from_checkpoint(checkpoint_directory, checkpoint_interval=60, time_limit=None, quiet=False,
+						   return_metrics=False):
+	"""
+	Continues a solve started by solve_with_checkpoints from its checkpoint directory, warm starting from the saved
+	incumbent and checkpointing into the same directory. Returns the same as solve_with_checkpoints, except that
+	a solve which already finished is not repeated: its subgraph is returned, with metrics None.
+	"""
+	graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition = read_DCSN_instance(
+		os.path.join(checkpoint_directory, INSTANCE_FILE_NAME), return_edge_existence=True)
+	checkpoint = read_checkpoint(checkpoint_directory)
+
+	if checkpoint['finished']:
+		subgraph = None
+		if checkpoint['edges'] is not None:
+			subgraph = networkx.DiGraph()
+			subgraph.add_edges_from((u, v, {'weight': graph[u][v]['weight']}) for u, v in checkpoint['edges'])
+		if not quiet:
+			print('Checkpointed %s solve already finished, objective %s' % (checkpoint['solver'],
+																			 checkpoint['objective']))
+		return (subgraph, None) if return_metrics else subgraph
+
+	if not quiet:
+		print('Resuming %s solve from incumbent objective %s, bound %s' % (
+			checkpoint['solver'], checkpoint['objective'], checkpoint['bound']))
+
+	return run_checkpointed_solve(checkpoint_directory, graph, existence_for_node_condition, connectivity_demands,
+								  existence_for_edge_condition, checkpoint, checkpoint_interval, time_limit, quiet,
+								  return_metrics)
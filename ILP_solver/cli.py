@@ -0,0 +1,148 @@
+"""
+This file implements the command-line interface over the DCSN tools:
+	python -m ILP_solver.cli generate instance.json.gz --nodes 200 --conditions 5 --demands 5
+	python -m ILP_solver.cli solve instance.json.gz --solver DCSN --output solution.json
+	python -m ILP_solver.cli verify instance.json.gz solution.json
+	python -m ILP_solver.cli bench run --nodes 50 100 --output results.json
+
+Instances and solutions are files in the compact format of graph_tools/instance_io.py. To keep short-lived
+processes fast, this module only imports the standard library: each command imports NetworkX, the optimization
+library and matplotlib only if it needs them, so generating and verifying never load the solver backend.
+"""
+import argparse
+import importlib
+import sys
+import time
+
+START_TIME = time.time()
+
+# Map from solver name to (module, entry point, extra keyword arguments), imported only when solving
+CLI_SOLVERS = {
+	'DCSN': ('ILP_solver.ILP_solver', 'solve_DCSN_instance', {}),
+	'single_source': ('ILP_solver.ILP_solver', 'solve_single_source_DCSN_instance', {}),
+	'single_source_tight': ('ILP_solver.ILP_solver', 'solve_single_source_DCSN_instance', {'formulation': 'tight'}),
+	'portfolio': ('ILP_solver.ILP_solver', 'solve_DCSN_instance', {'portfolio': True}),
+	'rounding': ('ILP_solver.rounding', 'solve_DCSN_instance_by_rounding', {}),
+	'sharing': ('ILP_solver.heuristic', 'solve_DCSN_instance_by_sharing', {}),
+}
+
+# Solvers that accept a warm start
+WARM_START_SOLVERS = ('DCSN', 'single_source', 'single_source_tight')
+
+# Modules reported by --timing if a command loaded them
+HEAVY_MODULES = ('networkx', 'gurobipy', 'matplotlib', 'numpy')
+
+
+def generate(arguments):
+	import random
+	import networkx
+	from graph_tools.generation import create_underlying_graph, create_sample_DCSN_instance
+	from graph_tools.instance_io import write_DCSN_instance
+
+	random.seed(arguments.seed)
+	graph = create_underlying_graph(arguments.nodes, arguments.average_degree)
+	candidate_sources = random.sample(graph.nodes(), min(100, graph.number_of_nodes()))
+	if not any(len(networkx.descendants(graph, node)) >= arguments.demands for node in candidate_sources):
+		print('No node reaches %s others; use more nodes or a higher average degree.' % arguments.demands)
+		return 1
+
+	graph, existence_for_node_condition, connectivity_demands = create_sample_DCSN_instance(
+		graph, arguments.conditions, arguments.demands, arguments.node_active_prob, quiet=True)
+	write_DCSN_instance(arguments.instance, graph, existence_for_node_condition, connectivity_demands)
+	print('Wrote instance with %s nodes, %s edges and %s demands to %s' % (
+		graph.number_of_nodes(), graph.number_of_edges(), len(connectivity_demands), arguments.instance))
+	return 0
+
+
+def solve(arguments):
+	from graph_tools.instance_io import read_DCSN_instance, write_solution_subgraph
+
+	module_name, function_name, options = CLI_SOLVERS[arguments.solver]
+	solve_instance = getattr(importlib.import_module(module_name), function_name)
+	options = dict(options)
+	if arguments.time_limit is not None:
+		options['time_limit'] = arguments.time_limit
+	if arguments.warm_start:
+		if arguments.solver not in WARM_START_SOLVERS:
+			print('Solver %s does not take a warm start.' % arguments.solver)
+			return 2
+		options['warm_start'] = 'shared_paths'
+
+	graph, existence_for_node_condition, connectivity_demands = read_DCSN_instance(arguments.instance)
+	subgraph, metrics = solve_instance(graph, existence_for_node_condition, connectivity_demands,
+									   detailed_output=arguments.detailed, quiet=arguments.quiet,
+									   drop_infeasible_demands=arguments.drop_infeasible_demands,
+									   return_metrics=True, **options)
+	if subgraph is None:
+		print('No solution found.')
+		return 1
+
+	if arguments.output is not None:
+		write_solution_subgraph(arguments.output, subgraph, solver=arguments.solver, objective=metrics.objective,
+								bound=metrics.bound, metrics=metrics.as_dict())
+	print('Objective %s with %s edges' % (metrics.objective, subgraph.number_of_edges()))
+	return 0
+
+
+def verify(arguments):
+	from graph_tools.instance_io import read_DCSN_instance, read_solution_subgraph
+	from graph_tools.verification import verify_DCSN_solution, print_verification
+
+	graph, existence_for_node_condition, connectivity_demands = read_DCSN_instance(arguments.instance)
+	subgraph, _ = read_solution_subgraph(arguments.solution)
+	violated_demands, objective = verify_DCSN_solution(graph, existence_for_node_condition, connectivity_demands,
+													   subgraph)
+	print_verification(violated_demands, objective)
+	return 1 if violated_demands else 0
+
+
+def bench(arguments):
+	import ILP_solver_benchmarks
+	return ILP_solver_benchmarks.main(arguments.benchmark_arguments)
+
+
+def main(arguments=None):
+	parser = argparse.ArgumentParser(description='Generate, solve and verify DCSN instances.')
+	parser.add_argument('--timing', action='store_true',
+						help='print the time since startup and the heavy modules loaded, on exit')
+	subparsers = parser.add_subparsers(dest='command')
+
+	generate_parser = subparsers.add_parser('generate', help='generate a random instance')
+	generate_parser.add_argument('instance', help='instance file to write (gzip-compressed if it ends with .gz)')
+	generate_parser.add_argument('--nodes', type=int, default=100)
+	generate_parser.add_argument('--average-degree', type=float, default=4)
+	generate_parser.add_argument('--conditions', type=int, default=5)
+	generate_parser.add_argument('--demands', type=int, default=5, help='demands per condition')
+	generate_parser.add_argument('--node-active-prob', type=float, default=.75)
+	generate_parser.add_argument('--seed', type=int, default=0)
+
+	solve_parser = subparsers.add_parser('solve', help='solve an instance')
+	solve_parser.add_argument('instance')
+	solve_parser.add_argument('--solver', default='DCSN', choices=sorted(CLI_SOLVERS))
+	solve_parser.add_argument('--output', help='solution file to write')
+	solve_parser.add_argument('--time-limit', type=float, default=None)
+	solve_parser.add_argument('--warm-start', action='store_true', help='warm start from the shared path heuristic')
+	solve_parser.add_argument('--drop-infeasible-demands', action='store_true')
+	solve_parser.add_argument('--quiet', action='store_true')
+	solve_parser.add_argument('--detailed', action='store_true', help='print the solution edges')
+
+	verify_parser = subparsers.add_parser('verify', help='check a solution against an instance')
+	verify_parser.add_argument('instance')
+	verify_parser.add_argument('solution')
+
+	bench_parser = subparsers.add_parser('bench', help='run ILP_solver_benchmarks.py with the given arguments')
+	bench_parser.add_argument('benchmark_arguments', nargs=argparse.REMAINDER)
+
+	arguments = parser.parse_args(arguments)
+	command = {'generate': generate, 'solve': solve, 'verify': verify, 'bench': bench}[arguments.command]
+	status = command(arguments)
+
+	if arguments.timing:
+		print('%.3f seconds since startup; loaded %s' % (
+			time.time() - START_TIME, ', '.join(name for name in HEAVY_MODULES if name in sys.modules) or 'nothing'))
+
+	return status
+
+
+if __name__ == "__main__":
+	sys.exit(main())
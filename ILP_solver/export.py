@@ -0,0 +1,273 @@
+"""
+This file implements streaming export of DCSN instances to LP and MPS model files, and recovery of subgraphs from
+solution files, so that models can be generated and solved on different machines.
+
+The exported model is the multi-commodity flow formulation that solve_DCSN_instance builds after reducing to
+DCSP, written without the auxiliary nodes of the reduction: demand k routes one unit of flow from its source to
+its target through nodes active at its condition.
+	- x_e    binary, edge e is in the subgraph
+	- f_e_k  binary, demand k routes flow along edge e (only if e is active at its condition: both endpoints
+	         exist, and so does e itself, if edge existence is given)
+	- link_e_k:  x_e - f_e_k >= 0
+	- flow_i_k:  (flow into node i) - (flow out of node i) = -1 at the source, 1 at the target, 0 otherwise
+Rows are generated one at a time from the graph and existence data; no model objects are built.
+"""
+import json
+import re
+
+import networkx
+
+from graph_tools.instance_io import tuples_from_lists
+
+TERMS_PER_LINE = 8
+EDGE_VARIABLE_PATTERN = re.compile(r'^x_(\d+)$')
+
+
+def edge_variable_name(edge_index):
+	return 'x_%s' % edge_index
+
+
+def flow_variable_name(edge_index, demand_index):
+	return 'f_%s_%s' % (edge_index, demand_index)
+
+
+def link_row_name(edge_index, demand_index):
+	return 'link_%s_%s' % (edge_index, demand_index)
+
+
+def flow_row_name(node_index, demand_index):
+	return 'flow_%s_%s' % (node_index, demand_index)
+
+
+class ModelStreams(object):
+	"""
+	Index of a DCSN instance used to stream the rows and columns of its model.
+	"""
+
+	def __init__(self, graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition=None):
+		self.graph = graph
+		self.existence_for_node_condition = existence_for_node_condition
+		self.existence_for_edge_condition = existence_for_edge_condition
+		self.connectivity_demands = connectivity_demands
+		self.index_for_node = {node: index for index, node in enumerate(graph.nodes_iter())}
+		self.edges = graph.edges()
+		self.index_for_edge = {edge: index for index, edge in enumerate(self.edges)}
+
+	def is_active(self, node, condition):
+		return self.existence_for_node_condition is None or self.existence_for_node_condition.get((node, condition), 0)
+
+	def is_edge_active(self, u, v, condition):
+		return bool(self.is_active(u, condition) and self.is_active(v, condition) and
+					(self.existence_for_edge_condition is None or
+					 self.existence_for_edge_condition.get((u, v, condition), 0)))
+
+	def has_flow_variable(self, u, v, demand_index):
+		return self.is_edge_active(u, v, self.connectivity_demands[demand_index][2])
+
+	def objective_terms(self):
+		for edge_index, (u, v) in enumerate(self.edges):
+			yield self.graph[u][v]['weight'], edge_variable_name(edge_index)
+
+	def link_rows(self):
+		"""
+		Yields (row name, terms, rhs) of every linking row, where terms are (coefficient, variable name) pairs.
+		"""
+		for demand_index in xrange(len(self.connectivity_demands)):
+			for edge_index, (u, v) in enumerate(self.edges):
+				if self.has_flow_variable(u, v, demand_index):
+					terms = [(1, edge_variable_name(edge_index)), (-1, flow_variable_name(edge_index, demand_index))]
+					yield link_row_name(edge_index, demand_index), terms, 0
+
+	def flow_rows(self):
+		"""
+		Yields (row name, terms, rhs) of every flow conservation row, where terms are (coefficient, variable name)
+		pairs. Rows without terms and with rhs 0 are skipped.
+
+		Raises a ValueError if a demand's source or target is inactive or has no active edge at its condition.
+		"""
+		for demand_index, (source, target, condition) in enumerate(self.connectivity_demands):
+			for v in self.graph.nodes_iter():
+				rhs = (-1 if v == source else 0) + (1 if v == target else 0)
+				if not self.is_active(v, condition):
+					if rhs != 0:
+						raise ValueError('Demand %s -> %s at condition %s is infeasible' % (source, target, condition))
+					continue
+
+				terms = []
+				for u in self.graph.predecessors_iter(v):
+					if self.is_edge_active(u, v, condition):
+						terms.append((1, flow_variable_name(self.index_for_edge[u, v], demand_index)))
+				for w in self.graph.successors_iter(v):
+					if self.is_edge_active(v, w, condition):
+						terms.append((-1, flow_variable_name(self.index_for_edge[v, w], demand_index)))
+
+				if not terms:
+					if rhs != 0:
+						raise ValueError('Demand %s -> %s at condition %s is infeasible' % (source, target, condition))
+					continue
+
+				yield flow_row_name(self.index_for_node[v], demand_index), terms, rhs
+
+	def edge_columns(self, edge_index):
+		"""
+		Yields (row name, coefficient) of every nonzero in the column of edge variable x_e.
+		"""
+		u, v = self.edges[edge_index]
+		yield 'obj', self.graph[u][v]['weight']
+		for demand_index in xrange(len(self.connectivity_demands)):
+			if self.has_flow_variable(u, v, demand_index):
+				yield link_row_name(edge_index, demand_index), 1
+
+	def flow_columns(self, edge_index, demand_index):
+		"""
+		Yields (row name, coefficient) of every nonzero in the column of flow variable f_e_k.
+		"""
+		u, v = self.edges[edge_index]
+		yield link_row_name(edge_index, demand_index), -1
+		yield flow_row_name(self.index_for_node[u], demand_index), -1
+		yield flow_row_name(self.index_for_node[v], demand_index), 1
+
+	def variable_names(self):
+		for edge_index in xrange(len(self.edges)):
+			yield edge_variable_name(edge_index)
+		for demand_index in xrange(len(self.connectivity_demands)):
+			for edge_index, (u, v) in enumerate(self.edges):
+				if self.has_flow_variable(u, v, demand_index):
+					yield flow_variable_name(edge_index, demand_index)
+
+
+def format_coefficient(coefficient):
+	return repr(coefficient) if isinstance(coefficient, float) else str(coefficient)
+
+
+def write_expression(model_file, terms):
+	"""
+	Writes a linear expression in LP format, wrapping long expressions over several lines.
+	"""
+	for term_index, (coefficient, name) in enumerate(terms):
+		if term_index > 0 and term_index % TERMS_PER_LINE == 0:
+			model_file.write('\n   ')
+		sign = '-' if coefficient < 0 else '+'
+		model_file.write(' %s %s %s' % (sign, format_coefficient(abs(coefficient)), name))
+
+
+def write_LP_model(model_file, streams):
+	model_file.write('\\ Directed Condition Steiner Network\n')
+	model_file.write('Minimize\n obj:')
+	write_expression(model_file, streams.objective_terms())
+	model_file.write('\nSubject To\n')
+
+	for name, terms, rhs in streams.link_rows():
+		model_file.write(' %s:' % name)
+		write_expression(model_file, terms)
+		model_file.write(' >= %s\n' % rhs)
+
+	for name, terms, rhs in streams.flow_rows():
+		model_file.write(' %s:' % name)
+		write_expression(model_file, terms)
+		model_file.write(' = %s\n' % rhs)
+
+	model_file.write('Binaries\n')
+	for name_index, name in enumerate(streams.variable_names()):
+		model_file.write(' ' + name)
+		if name_index % TERMS_PER_LINE == TERMS_PER_LINE - 1:
+			model_file.write('\n')
+	model_file.write('\nEnd\n')
+
+
+def write_MPS_model(model_file, streams):
+	model_file.write('NAME DCSN\n')
+	model_file.write('ROWS\n N obj\n')
+	for name, _, _ in streams.link_rows():
+		model_file.write(' G %s\n' % name)
+
+	# Flow rows are needed again for the RHS section; only the nonzero right-hand sides are kept
+	rhs_for_row = {}
+	for name, _, rhs in streams.flow_rows():
+		model_file.write(' E %s\n' % name)
+		if rhs != 0:
+			rhs_for_row[name] = rhs
+
+	model_file.write('COLUMNS\n')
+	for edge_index in xrange(len(streams.edges)):
+		for row_name, coefficient in streams.edge_columns(edge_index):
+			model_file.write(' %s %s %s\n' % (edge_variable_name(edge_index), row_name,
+											  format_coefficient(coefficient)))
+	for demand_index in xrange(len(streams.connectivity_demands)):
+		for edge_index, (u, v) in enumerate(streams.edges):
+			if streams.has_flow_variable(u, v, demand_index):
+				for row_name, coefficient in streams.flow_columns(edge_index, demand_index):
+					model_file.write(' %s %s %s\n' % (flow_variable_name(edge_index, demand_index), row_name,
+													  format_coefficient(coefficient)))
+
+	model_file.write('RHS\n')
+	for row_name, rhs in sorted(rhs_for_row.iteritems()):
+		model_file.write(' RHS %s %s\n' % (row_name, rhs))
+
+	model_file.write('BOUNDS\n')
+	for name in streams.variable_names():
+		model_file.write(' BV BND %s\n' % name)
+	model_file.write('ENDATA\n')
+
+
+def write_DCSN_model(path, graph, existence_for_node_condition, connectivity_demands, edge_map_path=None,
+					 existence_for_edge_condition=None):
+	"""
+	Given a DCSN instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}, or None if every node always exists
+		- A list of connectivity demands (source, target, condition)
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}
+
+	writes its ILP to path, in LP format if path ends with '.lp' and in (free) MPS format if it ends with '.mps'.
+	Also writes the map from edge variable index to edge and weight to edge_map_path (by default path + '.edges'),
+	which read_DCSN_solution needs to recover the subgraph.
+	"""
+	if path.endswith('.lp'):
+		write_model = write_LP_model
+	elif path.endswith('.mps'):
+		write_model = write_MPS_model
+	else:
+		raise ValueError('Unknown model format for %s, expected .lp or .mps' % path)
+
+	streams = ModelStreams(graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition)
+
+	with open(path, 'w') as model_file:
+		write_model(model_file, streams)
+
+	with open(edge_map_path or path + '.edges', 'w') as edge_map_file:
+		for u, v in streams.edges:
+			edge_map_file.write(json.dumps([u, v, graph[u][v]['weight']]) + '\n')
+
+
+def read_DCSN_solution(solution_path, edge_map_path):
+	"""
+	Given a solution file written by a standalone solver for a model exported with write_DCSN_model, and the
+	model's edge map, returns the solution subgraph with attribute 'weight' on all edges.
+
+	Reads any solution format listing a variable name followed by its value on one line, such as Gurobi .sol
+	files ('x_3 1') and CBC solution files ('12 x_3 1 2').
+	"""
+	chosen_edge_indices = set()
+	with open(solution_path) as solution_file:
+		for line in solution_file:
+			tokens = line.split()
+			for token_index, token in enumerate(tokens[:-1]):
+				match = EDGE_VARIABLE_PATTERN.match(token)
+				if match is None:
+					continue
+				try:
+					value = float(tokens[token_index + 1])
+				except ValueError:
+					continue
+				if value > 0.5:
+					chosen_edge_indices.add(int(match.group(1)))
+
+	subgraph = networkx.DiGraph()
+	with open(edge_map_path) as edge_map_file:
+		for edge_index, line in enumerate(edge_map_file):
+			if edge_index in chosen_edge_indices:
+				u, v, weight = json.loads(line)
+				subgraph.add_edge(tuples_from_lists(u), tuples_from_lists(v), weight=weight)
+
+	return subgraph
@@ -0,0 +1,216 @@
+"""
+This file implements a fast primal heuristic for DCSN instances that shares paths between conditions: once an edge
+is bought for any condition, it is free for every other. Each (source, condition) group of demands is routed in
+turn along shortest paths where already bought edges cost nothing, then improvement passes rip up each group and
+reroute it given everything else. Each pass runs one Dijkstra per group, so the running time is linear in the
+number of conditions. The result is available as a standalone solve mode, and as a warm start for the ILP solvers.
+"""
+import time
+
+import networkx
+
+from .metrics import SolveMetrics
+from graph_tools.active_subgraph import ActiveSubgraphIndex
+from graph_tools.feasibility import screen_connectivity_demands
+from graph_tools.visualization import print_edges_in_graph
+
+
+class SharedPathRouting(object):
+	"""
+	Paths from the source of every (source, condition) group of demands to its targets, in the active subgraph of
+	the condition. An edge is bought once any group's paths use it, and is free to every group from then on; the
+	given free_edges are free without being bought. Targets unreachable from their source are left unrouted.
+	"""
+
+	def __init__(self, graph, active_subgraph_index, connectivity_demands, free_edges=(), condition_order=None):
+		self.graph = graph
+		self.active_subgraph_index = active_subgraph_index
+		self.free_edges = set(free_edges)
+
+		# Group the demands by (source, condition); conditions with the most demands come first by default, as
+		# their paths are the most likely to be shared
+		self.targets_for_group = {}
+		demand_count_for_condition = {}
+		first_index_for_condition = {}
+		for demand_index, (source, target, condition) in enumerate(connectivity_demands):
+			if source != target:
+				self.targets_for_group.setdefault((source, condition), []).append(target)
+			demand_count_for_condition[condition] = demand_count_for_condition.get(condition, 0) + 1
+			first_index_for_condition.setdefault(condition, demand_index)
+		if condition_order is None:
+			condition_order = sorted(demand_count_for_condition, key=lambda condition: (
+				-demand_count_for_condition[condition], first_index_for_condition[condition]))
+		rank_for_condition = {condition: rank for rank, condition in enumerate(condition_order)}
+		self.groups = sorted(self.targets_for_group, key=lambda (source, condition): (
+			rank_for_condition.get(condition, len(rank_for_condition)), first_index_for_condition[condition]))
+
+		self.edges_for_group = {}
+		self.group_count_for_edge = {}
+
+	def cost(self, u, v):
+		if (u, v) in self.group_count_for_edge or (u, v) in self.free_edges:
+			return 0
+		return self.graph[u][v]['weight']
+
+	def marginal_cost(self, edges):
+		"""
+		Returns the weight of the given edges that are neither bought nor free.
+		"""
+		return sum(self.cost(u, v) for u, v in edges)
+
+	def route(self, group):
+		"""
+		Returns the set of edges on shortest paths from the group's source to its targets, at current costs.
+		"""
+		source, condition = group
+		# Until an edge is bought or free, costs are the edge weights, whose trees the index memoizes
+		weight = self.cost if self.group_count_for_edge or self.free_edges else 'weight'
+		_, predecessor_for_node = self.active_subgraph_index.shortest_path_tree(source, condition, weight)
+		edges = set()
+		for target in self.targets_for_group[group]:
+			v = target
+			while predecessor_for_node.get(v) is not None and (predecessor_for_node[v], v) not in edges:
+				edges.add((predecessor_for_node[v], v))
+				v = predecessor_for_node[v]
+
+		return edges
+
+	def add(self, group, edges):
+		self.edges_for_group[group] = edges
+		for edge in edges:
+			self.group_count_for_edge[edge] = self.group_count_for_edge.get(edge, 0) + 1
+
+	def remove(self, group):
+		edges = self.edges_for_group.pop(group)
+		for edge in edges:
+			self.group_count_for_edge[edge] -= 1
+			if not self.group_count_for_edge[edge]:
+				del self.group_count_for_edge[edge]
+
+		return edges
+
+	def route_all(self):
+		"""
+		Routes every group in order, each along shortest paths given the edges bought by the groups before it.
+		"""
+		for group in self.groups:
+			self.add(group, self.route(group))
+
+	def improve(self, pass_count, deadline=None):
+		"""
+		Runs up to pass_count improvement passes, stopping early after a pass without improvement or once the
+		deadline (a time.time() value) passes. Each pass rips up every group in turn and reroutes it given the edges
+		bought by all others, keeping the new paths if they buy less weight. Returns the number of passes run.
+		"""
+		for pass_index in xrange(pass_count):
+			improved = False
+			for group in self.groups:
+				if deadline is not None and time.time() > deadline:
+					return pass_index
+				old_edges = self.remove(group)
+				new_edges = self.route(group)
+				if self.marginal_cost(new_edges) < self.marginal_cost(old_edges) - 1e-9:
+					self.add(group, new_edges)
+					improved = True
+				else:
+					self.add(group, old_edges)
+			if not improved:
+				return pass_index + 1
+
+		return pass_count
+
+	def edges(self):
+		return self.group_count_for_edge.keys()
+
+	def weight(self):
+		return sum(self.graph[u][v]['weight'] for u, v in self.group_count_for_edge)
+
+
+def repair_subgraph(graph, active_subgraph_index, connectivity_demands, chosen_edges):
+	"""
+	Given a feasible DCSN instance, as its graph and ActiveSubgraphIndex, and a set of chosen edges, returns the set
+	of edges of a subgraph satisfying every demand: for each (source, condition), the shortest paths to its targets
+	in the active subgraph of the condition, where chosen edges (and edges already on a path) are free and other
+	edges cost their weight. Chosen edges on no path are dropped.
+	"""
+	routing = SharedPathRouting(graph, active_subgraph_index, connectivity_demands, free_edges=chosen_edges)
+	routing.route_all()
+
+	return set(routing.edges())
+
+
+def shared_path_warm_start(graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition=None,
+						   improvement_passes=3, condition_order=None, active_subgraph_index=None, deadline=None):
+	"""
+	Given a DCSN instance, returns the list of edges of the subgraph found by routing every (source, condition) group
+	of demands with SharedPathRouting, followed by up to improvement_passes improvement passes; pass it as the
+	warm_start of a solver. Demands without a path in their condition's active subgraph are left unsatisfied.
+	"""
+	if active_subgraph_index is None:
+		conditions = set(condition for source, target, condition in connectivity_demands)
+		active_subgraph_index = ActiveSubgraphIndex(graph, existence_for_node_condition, existence_for_edge_condition,
+													conditions)
+
+	routing = SharedPathRouting(graph, active_subgraph_index, connectivity_demands, condition_order=condition_order)
+	routing.route_all()
+	routing.improve(improvement_passes, deadline)
+
+	return routing.edges()
+
+
+def solve_DCSN_instance_by_sharing(graph, existence_for_node_condition, connectivity_demands, detailed_output=False,
+								   check_feasibility=True, drop_infeasible_demands=False, quiet=False,
+								   return_metrics=False, metrics=None, time_limit=None,
+								   existence_for_edge_condition=None, improvement_passes=3, condition_order=None,
+								   active_subgraph_index=None):
+	"""
+	Given a DCSN problem instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}
+		- A list of connectivity demands (source, target, condition)
+
+	returns a subgraph that satisfies the demands, found by the shared path heuristic (see shared_path_warm_start)
+	without solving any model. The subgraph is not necessarily of minimum weight; its weight is recorded as
+	metrics.objective. Conditions are routed in condition_order (by default, those with the most demands first).
+	If time_limit (in seconds) passes, improvement passes stop early.
+
+	See solve_DCSN_instance for check_feasibility, drop_infeasible_demands, quiet, return_metrics, metrics and
+	existence_for_edge_condition, and solve_DCSN_instance_by_rounding for active_subgraph_index.
+	"""
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+	deadline = time.time() + time_limit if time_limit is not None else None
+
+	with metrics.phase('pruning'):
+		if active_subgraph_index is None:
+			conditions = set(condition for source, target, condition in connectivity_demands)
+			active_subgraph_index = ActiveSubgraphIndex(graph, existence_for_node_condition,
+														existence_for_edge_condition, conditions)
+
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition, active_subgraph_index)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+
+	with metrics.phase('heuristic'):
+		edges = shared_path_warm_start(graph, existence_for_node_condition, connectivity_demands,
+									   existence_for_edge_condition, improvement_passes, condition_order,
+									   active_subgraph_index, deadline)
+		subgraph = networkx.DiGraph()
+		subgraph.add_edges_from((u, v, {'weight': graph[u][v]['weight']}) for u, v in edges)
+		metrics.objective = subgraph.size(weight='weight')
+
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+		print('Shared path heuristic found a subgraph of weight %s.' % metrics.objective)
+		if detailed_output:
+			print('Edges in subgraph:')
+			print_edges_in_graph(subgraph)
+		metrics.print_summary()
+
+	return solution(subgraph)
@@ -0,0 +1,133 @@
+"""
+This file implements metrics collection for solver runs.
+"""
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+
+def cpu_time():
+	"""
+	Returns the user + system CPU time consumed so far by this process (including solver threads), in seconds.
+	"""
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_kb():
+	"""
+	Returns the peak resident set size of this process so far, in kilobytes.
+	"""
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss  # macOS reports bytes
+
+
+class SolveMetrics(object):
+	"""
+	Collects timing and model-size information for one solve:
+		- Wall and CPU seconds per phase (pruning, reduction, heuristic, model_build, optimize, recovery,
+		  rounding)
+		- Variable, constraint and nonzero counts of every model built
+		- Branch-and-bound node count, and solver status, objective and bound of the last model optimized
+		- Peak resident set size of the process
+	"""
+	PHASES = ('pruning', 'reduction', 'heuristic', 'model_build', 'optimize', 'recovery', 'rounding')
+
+	def __init__(self):
+		self.wall_time_for_phase = {}
+		self.cpu_time_for_phase = {}
+		self.variable_count = 0
+		self.constraint_count = 0
+		self.nonzero_count = 0
+		self.node_count = 0
+		self.status = None
+		self.objective = None
+		self.bound = None
+		self.peak_rss_kb = peak_rss_kb()
+
+	@contextmanager
+	def phase(self, name):
+		"""
+		Context manager that adds the wall and CPU time spent in its body to the given phase.
+		"""
+		start_wall_time = time.time()
+		start_cpu_time = cpu_time()
+		try:
+			yield
+		finally:
+			self.wall_time_for_phase[name] = self.wall_time_for_phase.get(name, 0.0) + time.time() - start_wall_time
+			self.cpu_time_for_phase[name] = self.cpu_time_for_phase.get(name, 0.0) + cpu_time() - start_cpu_time
+			self.peak_rss_kb = max(self.peak_rss_kb, peak_rss_kb())
+
+	def record_model(self, model):
+		"""
+		Records the size of a built model.
+		"""
+		model.update()
+		self.variable_count += model.NumVars
+		self.constraint_count += model.NumConstrs
+		self.nonzero_count += model.NumNZs
+
+	def record_optimization(self, model):
+		"""
+		Records the outcome of an optimized model.
+		"""
+		self.status = model.status
+		if model.IsMIP:
+			self.node_count += int(model.NodeCount)
+			self.bound = model.ObjBound
+		if model.SolCount > 0:
+			self.objective = model.ObjVal
+
+	def merge(self, other):
+		"""
+		Adds the phase times, model sizes and node count of metrics recorded elsewhere (e.g. by another process), and
+		takes their status, objective and bound.
+		"""
+		for name in other.wall_time_for_phase:
+			self.wall_time_for_phase[name] = self.wall_time_for_phase.get(name, 0.0) + other.wall_time_for_phase[name]
+			self.cpu_time_for_phase[name] = self.cpu_time_for_phase.get(name, 0.0) + other.cpu_time_for_phase[name]
+		self.variable_count += other.variable_count
+		self.constraint_count += other.constraint_count
+		self.nonzero_count += other.nonzero_count
+		self.node_count += other.node_count
+		self.status = other.status
+		self.objective = other.objective
+		self.bound = other.bound
+		self.peak_rss_kb = max(self.peak_rss_kb, other.peak_rss_kb)
+
+	def total_wall_time(self):
+		return sum(self.wall_time_for_phase.values())
+
+	def total_cpu_time(self):
+		return sum(self.cpu_time_for_phase.values())
+
+	def as_dict(self):
+		"""
+		Returns the metrics as a plain dictionary, e.g. for serialization.
+		"""
+		return {
+			'wall_time_for_phase': dict(self.wall_time_for_phase),
+			'cpu_time_for_phase': dict(self.cpu_time_for_phase),
+			'total_wall_time': self.total_wall_time(),
+			'total_cpu_time': self.total_cpu_time(),
+			'variable_count': self.variable_count,
+			'constraint_count': self.constraint_count,
+			'nonzero_count': self.nonzero_count,
+			'node_count': self.node_count,
+			'status': self.status,
+			'objective': self.objective,
+			'bound': self.bound,
+			'peak_rss_kb': self.peak_rss_kb,
+		}
+
+	def print_summary(self):
+		print('Phase            wall (s)     CPU (s)')
+		phases = list(self.PHASES) + sorted(set(self.wall_time_for_phase) - set(self.PHASES))
+		for name in phases:
+			if name in self.wall_time_for_phase:
+				print('%-15s %9.3f %11.3f' % (name, self.wall_time_for_phase[name], self.cpu_time_for_phase[name]))
+		print('%-15s %9.3f %11.3f' % ('total', self.total_wall_time(), self.total_cpu_time()))
+		print('Variables: %s, constraints: %s, nonzeros: %s, B&B nodes: %s, peak RSS: %s KB' % (
+			self.variable_count, self.constraint_count, self.nonzero_count, self.node_count, self.peak_rss_kb))
@@ -0,0 +1,281 @@
+"""
+This file implements portfolio solving of DCSN instances: several formulations are raced in separate processes,
+sharing the best incumbent found so far, and the first to prove optimality wins. The shared path heuristic runs
+alongside them to seed the shared incumbent.
+"""
+import multiprocessing
+import time
+from Queue import Empty
+
+import networkx
+from gurobipy import GRB
+
+from .ILP_solver import solve_DCSN_instance, solve_single_source_DCSN_instance, build_active_subgraph_index
+from .heuristic import solve_DCSN_instance_by_sharing, shared_path_warm_start
+from .metrics import SolveMetrics
+from graph_tools.feasibility import screen_connectivity_demands
+from graph_tools.visualization import print_edges_in_graph
+
+# Map from configuration name to (solver entry point, extra keyword arguments, whether the configuration needs
+# a single source per condition)
+PORTFOLIO_CONFIGURATIONS = {
+	'DCSN': (solve_DCSN_instance, {}, False),
+	'single_source': (solve_single_source_DCSN_instance, {}, True),
+	'single_source_tight': (solve_single_source_DCSN_instance, {'formulation': 'tight'}, True),
+	'sharing': (solve_DCSN_instance_by_sharing, {}, False),
+}
+
+# Configurations that build no model: they take no callback, warm start or thread count, and offer their subgraph
+# to the shared incumbent once found
+HEURISTIC_CONFIGURATIONS = ('sharing',)
+
+# Seconds to wait for interrupted configurations to report their incumbents once the time budget expires
+INCUMBENT_GRACE_PERIOD = 5
+
+# Seconds between checks that the configuration processes are still alive
+PROCESS_POLL_INTERVAL = 1
+
+
+def is_single_source_instance(connectivity_demands):
+	"""
+	Returns whether every condition has a single source among the demands.
+	"""
+	source_for_condition = {}
+	for source, target, condition in connectivity_demands:
+		if source_for_condition.setdefault(condition, source) != source:
+			return False
+
+	return True
+
+
+class SharedIncumbent(object):
+	"""
+	Best solution found by any configuration: its objective in shared memory, so it is cheap to poll from
+	callbacks, and its edges in a manager dictionary, read only when the objective improves.
+	"""
+
+	def __init__(self, manager):
+		self.objective = multiprocessing.Value('d', float('inf'))
+		self.incumbent = manager.dict()
+
+	def offer(self, objective, edges):
+		with self.objective.get_lock():
+			if objective < self.objective.value - 1e-9:
+				self.incumbent.update(objective=objective, edges=edges)
+				self.objective.value = objective
+
+	def best(self):
+		with self.objective.get_lock():
+			return self.objective.value, self.incumbent.get('edges')
+
+
+def incumbent_sharing_callback(graph, shared_incumbent, stop_event, deadline):
+	"""
+	Returns a Gurobi callback that publishes every improving solution to shared_incumbent, injects better
+	solutions found by other configurations as (partial) solutions on the original graph's edges, and stops
+	optimization once stop_event is set or the deadline passes.
+	"""
+	state = {'injected_objective': float('inf')}
+
+	def callback(model, where):
+		if stop_event.is_set() or (deadline is not None and time.time() > deadline):
+			model.terminate()
+			return
+
+		if where == GRB.Callback.MIPSOL:
+			value_for_edge = model.cbGetSolution(model._edge_variables)
+			edges = [(u, v) for (u, v), value in value_for_edge.iteritems() if value > 0.5 and graph.has_edge(u, v)]
+			shared_incumbent.offer(model.cbGet(GRB.Callback.MIPSOL_OBJ), edges)
+
+		elif where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL:
+			objective = shared_incumbent.objective.value
+			if objective < min(model.cbGet(GRB.Callback.MIPNODE_OBJBST), state['injected_objective']) - 1e-9:
+				objective, edges = shared_incumbent.best()
+				if edges is None:
+					return
+				chosen_edges = set(edges)
+				original_edges = [(u, v) for u, v in model._edge_variables if graph.has_edge(u, v)]
+				model.cbSetSolution([model._edge_variables[edge] for edge in original_edges],
+									[1.0 if edge in chosen_edges else 0.0 for edge in original_edges])
+				model.cbUseSolution()
+				state['injected_objective'] = objective
+
+	return callback
+
+
+def run_configuration(name, graph, existence_for_node_condition, connectivity_demands, shared_incumbent,
+					  stop_event, deadline, results, existence_for_edge_condition=None, warm_start=None, threads=None,
+					  active_subgraph_index=None):
+	"""
+	Solves the instance with one configuration and puts (name, edges with weights or None, metrics) on results.
+	Model-based configurations start from warm_start, if given, and use at most threads threads; every configuration
+	gets the (forked copy of the) portfolio's active_subgraph_index.
+	"""
+	solve, options, _ = PORTFOLIO_CONFIGURATIONS[name]
+	options = dict(options)
+	if name not in HEURISTIC_CONFIGURATIONS:
+		options.update(callback=incumbent_sharing_callback(graph, shared_incumbent, stop_event, deadline),
+					   warm_start=warm_start, threads=threads)
+	time_limit = max(deadline - time.time(), 0) if deadline is not None else None
+
+	try:
+		subgraph, metrics = solve(graph, existence_for_node_condition, connectivity_demands, check_feasibility=False,
+								  quiet=True, return_metrics=True, time_limit=time_limit,
+								  existence_for_edge_condition=existence_for_edge_condition,
+								  active_subgraph_index=active_subgraph_index, **options)
+		edges = subgraph.edges(data=True) if subgraph is not None else None
+		if name in HEURISTIC_CONFIGURATIONS and subgraph is not None:
+			shared_incumbent.offer(metrics.objective, subgraph.edges())
+		results.put((name, edges, metrics))
+	except Exception as error:
+		results.put((name, None, '%s: %s' % (type(error).__name__, error)))
+
+
+def solve_portfolio(graph, existence_for_node_condition, connectivity_demands, configurations=None, time_limit=None,
+					detailed_output=False, check_feasibility=True, drop_infeasible_demands=False, quiet=False,
+					return_metrics=False, metrics=None, warm_start=None, existence_for_edge_condition=None, threads=None,
+					active_subgraph_index=None):
+	"""
+	Given a DCSN problem instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}
+		- A list of connectivity demands (source, target, condition)
+
+	solves it with every named configuration of PORTFOLIO_CONFIGURATIONS at once (by default, all of them that
+	apply to the instance), each in its own process. Improving solutions are shared between the configurations.
+	As soon as one proves optimality, the others are stopped and its subgraph is returned. If time_limit seconds
+	pass first, every configuration is stopped and the best subgraph found is returned (None if there is none),
+	including incumbents of configurations that did not report back within INCUMBENT_GRACE_PERIOD seconds.
+	Configurations whose process dies (e.g. killed for running out of memory) are dropped from the race.
+
+	The threads (by default, one per CPU) are split evenly between the model-based configurations. A warm start
+	(edges of a feasible subgraph, or 'shared_paths' to compute them first with the shared path heuristic) seeds
+	the shared incumbent and starts every model-based configuration.
+
+	See solve_DCSN_instance for detailed_output, check_feasibility, drop_infeasible_demands, quiet, return_metrics,
+	metrics, existence_for_edge_condition and active_subgraph_index (built once here, if not given, and shared with
+	every configuration); the metrics returned are those of the winning configuration, added to the pruning and
+	warm start phases run before the race.
+	"""
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+
+	if active_subgraph_index is None:
+		active_subgraph_index = build_active_subgraph_index(graph, existence_for_node_condition, connectivity_demands,
+															existence_for_edge_condition, metrics)
+
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition, active_subgraph_index)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+		if not connectivity_demands:
+			return solution(networkx.DiGraph())  # Nothing left to connect
+
+	if configurations is None:
+		single_source = is_single_source_instance(connectivity_demands)
+		configurations = [name for name, (_, _, needs_single_source) in sorted(PORTFOLIO_CONFIGURATIONS.items())
+						  if single_source or not needs_single_source]
+	for name in configurations:
+		if name not in PORTFOLIO_CONFIGURATIONS:
+			raise ValueError('Unknown portfolio configuration %s' % name)
+
+	if warm_start == 'shared_paths':
+		with metrics.phase('heuristic'):
+			warm_start = shared_path_warm_start(graph, existence_for_node_condition, connectivity_demands,
+												existence_for_edge_condition, active_subgraph_index=active_subgraph_index)
+
+	model_configuration_count = len([name for name in configurations if name not in HEURISTIC_CONFIGURATIONS])
+	threads_per_configuration = max(1, (threads or multiprocessing.cpu_count()) // max(model_configuration_count, 1))
+
+	manager = multiprocessing.Manager()
+	shared_incumbent = SharedIncumbent(manager)
+	stop_event = multiprocessing.Event()
+	results = multiprocessing.Queue()
+	deadline = time.time() + time_limit if time_limit is not None else None
+	if warm_start is not None:
+		warm_start = list(warm_start)
+		shared_incumbent.offer(sum(graph[u][v]['weight'] for u, v in warm_start), warm_start)
+
+	processes = {}
+	for name in configurations:
+		processes[name] = multiprocessing.Process(
+			target=run_configuration, args=(name, graph, existence_for_node_condition, connectivity_demands,
+											shared_incumbent, stop_event, deadline, results,
+											existence_for_edge_condition, warm_start, threads_per_configuration,
+											active_subgraph_index))
+		processes[name].start()
+
+	# Collect results until one configuration proves optimality, or all have stopped. Once the time budget is over,
+	# configurations are stopped and given a grace period to report back.
+	best_subgraph, best_metrics, best_name = None, None, None
+	pending = set(configurations)
+	stop_time = deadline
+	while pending:
+		wait_time = PROCESS_POLL_INTERVAL
+		if stop_time is not None:
+			wait_time = min(wait_time, max(stop_time - time.time(), 0))
+		try:
+			name, edges, configuration_metrics = results.get(timeout=wait_time)
+		except Empty:
+			for name in sorted(pending):
+				if processes[name].exitcode not in (None, 0):  # Died without reporting back
+					pending.discard(name)
+					if not quiet:
+						print('Configuration %s died with exit code %s' % (name, processes[name].exitcode))
+			if stop_time is not None and time.time() >= stop_time:
+				if stop_event.is_set():
+					break
+				stop_event.set()
+				stop_time = time.time() + INCUMBENT_GRACE_PERIOD
+			continue
+
+		pending.discard(name)
+		if not isinstance(configuration_metrics, SolveMetrics):
+			if not quiet:
+				print('Configuration %s failed: %s' % (name, configuration_metrics))
+			continue
+		if not quiet:
+			print('Configuration %s finished with status %s, objective %s' % (
+				name, configuration_metrics.status, configuration_metrics.objective))
+
+		if edges is not None and (best_subgraph is None or configuration_metrics.objective < best_metrics.objective):
+			best_subgraph = networkx.DiGraph()
+			best_subgraph.add_edges_from(edges)
+			best_metrics, best_name = configuration_metrics, 'configuration %s' % name
+		if configuration_metrics.status == GRB.status.OPTIMAL:
+			break
+
+	# Fall back on the shared incumbent, if a configuration that did not report back found a better subgraph
+	objective, edges = shared_incumbent.best()
+	if edges is not None and (best_subgraph is None or objective < best_metrics.objective - 1e-9):
+		best_subgraph = networkx.DiGraph()
+		best_subgraph.add_edges_from((u, v, {'weight': graph[u][v]['weight']}) for u, v in edges)
+		best_metrics, best_name = SolveMetrics(), 'the shared incumbent'
+		best_metrics.objective = objective
+
+	# Cancel the remaining configurations
+	stop_event.set()
+	for process in processes.itervalues():
+		process.terminate()
+		process.join()
+	manager.shutdown()
+
+	if best_metrics is not None:
+		metrics.merge(best_metrics)
+
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+		if best_subgraph is None:
+			print('Portfolio found no solution.')
+		else:
+			print('Portfolio solution from %s, objective %s' % (best_name, best_metrics.objective))
+			if detailed_output:
+				print('Edges in subgraph:')
+				print_edges_in_graph(best_subgraph)
+
+	return solution(best_subgraph)
@@ -0,0 +1,221 @@
+"""
+This file implements a fast bound-and-round mode for DCSN instances, for triage runs that only need a near-optimal
+subgraph and a lower bound. The LP relaxation of the multi-commodity flow formulation (with one unit of flow per
+demand, as solve_DCSN_instance builds after reducing to DCSP) is solved on a pruned graph, giving the bound. Its
+edge values are then rounded, and every demand is repaired with a shortest path in the active subgraph of its
+condition, giving a feasible subgraph.
+"""
+import random
+
+import networkx
+from gurobipy import Model, GRB, quicksum
+
+from .ILP_solver import build_active_subgraph_index
+from .heuristic import repair_subgraph
+from .metrics import SolveMetrics
+from graph_tools.feasibility import condition_masks, reachable_mask_for_node_map, screen_connectivity_demands
+from graph_tools.visualization import print_edges_in_graph
+
+
+def usable_edges_for_demand_map(graph, existence_for_node_condition, connectivity_demands,
+								existence_for_edge_condition=None, active_subgraph_index=None):
+	"""
+	Given a DCSN instance, returns a dictionary from demand index to the list of edges (u, v) that lie on some
+	source -> target path of the demand in the active subgraph of its condition: u is reachable from the source and
+	v reaches the target. Only these edges can carry the demand's flow, so no other flow variables are needed.
+
+	Uses one forward bitmask traversal per distinct source and one backward traversal per distinct target, with
+	the masks of active_subgraph_index if given.
+	"""
+	conditions = set(condition for source, target, condition in connectivity_demands)
+	bit_for_condition, active_mask_for_node, active_mask_for_edge = condition_masks(
+		graph, existence_for_node_condition, conditions, existence_for_edge_condition, active_subgraph_index)
+
+	demanded_mask_for_source = {}
+	demanded_mask_for_target = {}
+	for source, target, condition in connectivity_demands:
+		demanded_mask_for_source[source] = demanded_mask_for_source.get(source, 0) | bit_for_condition[condition]
+		demanded_mask_for_target[target] = demanded_mask_for_target.get(target, 0) | bit_for_condition[condition]
+
+	forward_mask_for_source_node = {
+		source: reachable_mask_for_node_map(graph, source, mask & active_mask_for_node[source], active_mask_for_node,
+											active_mask_for_edge)
+		for source, mask in demanded_mask_for_source.iteritems()}
+	backward_mask_for_target_node = {
+		target: reachable_mask_for_node_map(graph, target, mask & active_mask_for_node[target], active_mask_for_node,
+											active_mask_for_edge, reverse=True)
+		for target, mask in demanded_mask_for_target.iteritems()}
+
+	usable_edges_for_demand = {}
+	for demand_index, (source, target, condition) in enumerate(connectivity_demands):
+		if source == target:
+			usable_edges_for_demand[demand_index] = []  # Trivially satisfied
+			continue
+		bit = bit_for_condition[condition]
+		forward_mask_for_node = forward_mask_for_source_node[source]
+		backward_mask_for_node = backward_mask_for_target_node[target]
+		usable_edges_for_demand[demand_index] = [
+			(u, v) for u, mask in forward_mask_for_node.iteritems() if mask & bit
+			for v in graph.successors_iter(u)
+			if backward_mask_for_node.get(v, 0) & bit and
+			(active_mask_for_edge is None or active_mask_for_edge.get((u, v), 0) & bit)]
+
+	return usable_edges_for_demand
+
+
+def round_relaxation(graph, active_subgraph_index, connectivity_demands, value_for_edge, rounding_count=10, seed=0):
+	"""
+	Given a feasible DCSN instance, as its graph and ActiveSubgraphIndex, and a dictionary from edge to its
+	(fractional) value in the LP relaxation, returns the lowest weight set of edges satisfying every demand among
+	rounding_count + 1 roundings, each repaired with repair_subgraph: first the edges with value at least 1/2, then
+	rounding_count independent randomized roundings, which choose each edge with probability equal to its value.
+	"""
+	generator = random.Random(seed)
+
+	def weight(edges):
+		return sum(graph[u][v]['weight'] for u, v in edges)
+
+	best_edges = None
+	for rounding_index in xrange(rounding_count + 1):
+		if rounding_index == 0:
+			chosen_edges = [edge for edge, value in value_for_edge.iteritems() if value >= 0.5]
+		else:
+			chosen_edges = [edge for edge, value in value_for_edge.iteritems() if generator.random() < value]
+
+		edges = repair_subgraph(graph, active_subgraph_index, connectivity_demands, chosen_edges)
+		if best_edges is None or weight(edges) < weight(best_edges):
+			best_edges = edges
+
+	return best_edges
+
+
+def solve_DCSN_instance_by_rounding(graph, existence_for_node_condition, connectivity_demands, detailed_output=False,
+									check_feasibility=True, drop_infeasible_demands=False, quiet=False,
+									return_metrics=False, metrics=None, time_limit=None, callback=None,
+									existence_for_edge_condition=None, rounding_count=10, seed=0,
+									active_subgraph_index=None, threads=None):
+	"""
+	Given a DCSN problem instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}
+		- A list of connectivity demands (source, target, condition)
+
+	returns a subgraph that satisfies the demands, found by solving the LP relaxation of the flow formulation on the
+	edges usable by each demand (see usable_edges_for_demand_map), then rounding its edge values rounding_count + 1
+	times with the given random seed (see round_relaxation). The subgraph is not necessarily of minimum weight: the
+	LP objective, a lower bound on the minimum weight, is printed with it and recorded as metrics.bound (and the
+	subgraph's weight as metrics.objective).
+
+	The time limit applies to the LP solve; if it is reached first, there is no bound and None is returned.
+
+	Every stage queries the active subgraphs through active_subgraph_index, an ActiveSubgraphIndex of the instance
+	covering the demanded conditions; one is built if not given, but callers running other stages on the same
+	instance can share theirs.
+
+	See solve_DCSN_instance for check_feasibility, drop_infeasible_demands, quiet, return_metrics, metrics,
+	time_limit, callback, existence_for_edge_condition and threads.
+	"""
+	def solution(subgraph):
+		return (subgraph, metrics) if return_metrics else subgraph
+
+	metrics = metrics if metrics is not None else SolveMetrics()
+
+	if active_subgraph_index is None:
+		active_subgraph_index = build_active_subgraph_index(graph, existence_for_node_condition, connectivity_demands,
+															existence_for_edge_condition, metrics)
+
+	if check_feasibility:
+		with metrics.phase('pruning'):
+			connectivity_demands = screen_connectivity_demands(graph, existence_for_node_condition,
+															   connectivity_demands, drop_infeasible_demands, quiet,
+															   existence_for_edge_condition, active_subgraph_index)
+		if connectivity_demands is None:
+			return solution(None)  # No solution
+
+	with metrics.phase('pruning'):
+		usable_edges_for_demand = usable_edges_for_demand_map(graph, existence_for_node_condition,
+															  connectivity_demands, existence_for_edge_condition,
+															  active_subgraph_index)
+
+	with metrics.phase('model_build'):
+		# MODEL SETUP
+		model = Model('Directed_Condition_Steiner_Network_relaxation')
+		if threads is not None:
+			model.params.Threads = threads
+		if quiet:
+			model.params.OutputFlag = 0
+		if time_limit is not None:
+			model.params.TimeLimit = time_limit
+
+		# Create variables f_{uvk} in [0, 1] for the edges usable by demand k, and x_{uv} in [0, 1] for the edges
+		# usable by any demand
+		edge_demand_variables = {}
+		edge_variables = {}
+		for demand_index, usable_edges in usable_edges_for_demand.iteritems():
+			for u, v in usable_edges:
+				edge_demand_variables[u, v, demand_index] = model.addVar(lb=0, ub=1,
+																		 name='edge_demand_%s_%s_%s' % (u, v, demand_index))
+				if (u, v) not in edge_variables:
+					edge_variables[u, v] = model.addVar(lb=0, ub=1, name='edge_%s_%s' % (u, v))
+
+		model.update()
+
+		# CONSTRAINTS
+		# Edge decision constraints (an edge is chosen at least as much as any demand uses it)
+		for u, v, demand_index in edge_demand_variables:
+			model.addConstr(edge_variables[u, v] >= edge_demand_variables[u, v, demand_index])
+
+		# Flow conservation constraints, at the nodes touched by each demand's usable edges
+		for demand_index, (source, target, condition) in enumerate(connectivity_demands):
+			if source == target:
+				continue
+			in_variables_for_node = {source: [], target: []}
+			out_variables_for_node = {source: [], target: []}
+			for u, v in usable_edges_for_demand[demand_index]:
+				out_variables_for_node.setdefault(u, []).append(edge_demand_variables[u, v, demand_index])
+				in_variables_for_node.setdefault(v, []).append(edge_demand_variables[u, v, demand_index])
+			for node in set(in_variables_for_node) | set(out_variables_for_node):
+				sourceflow = 1 if node == source else -1 if node == target else 0
+				model.addConstr(quicksum(in_variables_for_node.get(node, [])) + sourceflow ==
+								quicksum(out_variables_for_node.get(node, [])))
+
+		# OBJECTIVE
+		# Minimize total (fractional) subgraph weight
+		model.setObjective(quicksum(variable * graph[u][v]['weight'] for (u, v), variable in edge_variables.iteritems()),
+						   GRB.MINIMIZE)
+
+		metrics.record_model(model)
+
+	# SOLVE RELAXATION, THEN ROUND
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+	model._edge_variables = edge_variables
+	with metrics.phase('optimize'):
+		model.optimize(callback)
+	metrics.record_optimization(model)
+
+	if model.status != GRB.OPTIMAL:
+		if not quiet:
+			print('LP relaxation was not solved to optimality (status %s).' % model.status)
+		return solution(None)
+	metrics.bound = model.ObjVal
+
+	with metrics.phase('rounding'):
+		value_for_edge = model.getAttr('x', edge_variables)
+		edges = round_relaxation(graph, active_subgraph_index, connectivity_demands, value_for_edge, rounding_count,
+								 seed)
+		subgraph = networkx.DiGraph()
+		subgraph.add_edges_from((u, v, {'weight': graph[u][v]['weight']}) for u, v in edges)
+		metrics.objective = subgraph.size(weight='weight')
+
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+		print('Rounded DCSN LP relaxation: objective %s, LP bound %s (gap %.2f%%)' % (
+			metrics.objective, metrics.bound,
+			100.0 * (metrics.objective - metrics.bound) / metrics.objective if metrics.objective else 0.0))
+		if detailed_output:
+			print('Edges in subgraph:')
+			print_edges_in_graph(subgraph)
+		metrics.print_summary()
+
+	return solution(subgraph)
@@ -0,0 +1,403 @@
+"""
+This file implements a long-running local solve service. Clients submit instances in the compact format of
+graph_tools/instance_io.py over localhost HTTP; jobs are queued by priority and solved on a bounded pool of warm
+worker processes, which report incumbents while they run. Jobs whose worker process dies are failed, and the
+records of finished jobs are kept up to a retention limit.
+
+Start the service:
+	python -m ILP_solver.service --port 8765 --workers 4
+
+Endpoints (all bodies and responses are JSON):
+	POST   /jobs        {"instance": ..., "solver": "DCSN", "options": {}, "priority": 0, "time_limit": null}
+	                    -> {"job_id": ...}; lower priority values run first
+	GET    /jobs        -> {"jobs": [job summary, ...]}
+	GET    /jobs/<id>   -> job, including incumbent and result edges; with ?since=<version>&wait=<seconds>, waits up
+	                    to that long for the job to change past that version (long polling, to stream incumbents)
+	DELETE /jobs/<id>   -> cancels a queued or running job
+"""
+import argparse
+import errno
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import urllib2
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from Queue import PriorityQueue
+from SocketServer import ThreadingMixIn
+
+from gurobipy import GRB
+
+from .ILP_solver import solve_DCSN_instance, solve_single_source_DCSN_instance
+from .rounding import solve_DCSN_instance_by_rounding
+from .heuristic import solve_DCSN_instance_by_sharing
+from graph_tools.instance_io import DCSN_instance_from_dict, DCSN_instance_to_dict
+
+# Map from solver name to solver entry point
+SERVICE_SOLVERS = {
+	'DCSN': solve_DCSN_instance,
+	'single_source': solve_single_source_DCSN_instance,
+	'rounding': solve_DCSN_instance_by_rounding,
+	'sharing': solve_DCSN_instance_by_sharing,
+}
+
+# Solvers that build no model, so take no callback: they report no incumbents and run to completion once started
+HEURISTIC_SOLVERS = ('sharing',)
+
+# Seconds between checks for cancellation from inside a running solve
+CANCELLATION_POLL_INTERVAL = 1
+
+# Seconds between checks that the workers of dispatched jobs are alive
+WORKER_POLL_INTERVAL = 1
+
+# Seconds past its time limit after which a job that has not reported back is given up
+JOB_TIMEOUT_GRACE_PERIOD = 300
+
+
+def incumbent_reporting_callback(job_id, graph, updates, cancelled_job_ids):
+	"""
+	Returns a Gurobi callback that reports every improving incumbent (restricted to the edges of graph) on the
+	updates queue, and stops optimization once the job is cancelled.
+	"""
+	state = {'last_poll_time': time.time()}
+
+	def callback(model, where):
+		if time.time() - state['last_poll_time'] > CANCELLATION_POLL_INTERVAL:
+			state['last_poll_time'] = time.time()
+			if job_id in cancelled_job_ids:
+				model.terminate()
+				return
+
+		if where == GRB.Callback.MIPSOL:
+			value_for_edge = model.cbGetSolution(model._edge_variables)
+			edges = [[u, v] for (u, v), value in value_for_edge.iteritems() if value > 0.5 and graph.has_edge(u, v)]
+			updates.put((job_id, {'incumbent_objective': model.cbGet(GRB.Callback.MIPSOL_OBJ),
+								  'incumbent_edges': edges,
+								  'bound': model.cbGet(GRB.Callback.MIPSOL_OBJBND)}))
+
+	return callback
+
+
+def run_job(job_id, instance, solver, options, time_limit, updates, cancelled_job_ids, threads=None):
+	"""
+	Solves one job in a worker process, and returns (job_id, fields to update in the job record). Model-based
+	solvers use at most threads threads, unless the job's options set them.
+	"""
+	if job_id in cancelled_job_ids:
+		return job_id, {'status': 'cancelled'}  # Cancelled while being dispatched
+
+	updates.put((job_id, {'status': 'running', 'started_time': time.time(), 'worker_pid': os.getpid()}))
+	try:
+		graph, existence_for_node_condition, connectivity_demands = DCSN_instance_from_dict(instance)
+		options = dict(options)
+		if solver not in HEURISTIC_SOLVERS:
+			options['callback'] = incumbent_reporting_callback(job_id, graph, updates, cancelled_job_ids)
+			if threads is not None:
+				options.setdefault('threads', threads)
+		subgraph, metrics = SERVICE_SOLVERS[solver](graph, existence_for_node_condition, connectivity_demands,
+													quiet=True, return_metrics=True, time_limit=time_limit,
+													**options)
+	except Exception as error:
+		return job_id, {'status': 'failed', 'error': '%s: %s' % (type(error).__name__, error)}
+
+	edges = [[u, v, data['weight']] for u, v, data in subgraph.edges_iter(data=True)] if subgraph is not None else None
+	return job_id, {'status': 'cancelled' if job_id in cancelled_job_ids else 'done', 'edges': edges,
+					'objective': metrics.objective, 'bound': metrics.bound, 'metrics': metrics.as_dict()}
+
+
+def is_process_alive(pid):
+	try:
+		os.kill(pid, 0)
+	except OSError as error:
+		return error.errno != errno.ESRCH
+	return True
+
+
+class SolveService(object):
+	"""
+	Job queue and worker pool behind the HTTP interface. The CPUs are split evenly between the workers, so that
+	a full pool does not oversubscribe the machine. Only the last max_finished_jobs finished jobs are kept.
+	"""
+
+	def __init__(self, worker_count, max_finished_jobs=10000):
+		self.worker_count = worker_count
+		self.threads_per_worker = max(1, multiprocessing.cpu_count() // worker_count)
+		self.max_finished_jobs = max_finished_jobs
+		self.manager = multiprocessing.Manager()
+		self.updates = self.manager.Queue()
+		self.cancelled_job_ids = self.manager.dict()
+		self.pool = multiprocessing.Pool(worker_count)
+
+		self.jobs = {}
+		self.job_ids = itertools.count()
+		self.changed = threading.Condition()
+		self.queue = PriorityQueue()
+		self.free_workers = threading.Semaphore(worker_count)
+		self.dispatched_job_ids = set()  # Handed to the pool, and not yet finished
+		self.finished_job_ids = deque()  # From the earliest finished
+		self.closed = False
+
+		for target in [self.dispatch_jobs, self.apply_updates, self.watch_workers]:
+			thread = threading.Thread(target=target)
+			thread.daemon = True
+			thread.start()
+
+	def close(self):
+		self.closed = True
+		self.pool.terminate()
+		self.manager.shutdown()
+
+	def submit(self, instance, solver='DCSN', options=None, priority=0, time_limit=None):
+		if solver not in SERVICE_SOLVERS:
+			raise ValueError('Unknown solver %s, expected one of %s' % (solver, ', '.join(sorted(SERVICE_SOLVERS))))
+
+		with self.changed:
+			job_id = str(next(self.job_ids))
+			self.jobs[job_id] = {
+				'job_id': job_id, 'status': 'queued', 'priority': priority, 'solver': solver,
+				'time_limit': time_limit, 'submitted_time': time.time(), 'version': 0,
+			}
+			self.queue.put((priority, int(job_id), job_id, instance, solver, options or {}, time_limit))
+
+		return job_id
+
+	def dispatch_jobs(self):
+		"""
+		Hands queued jobs to the pool in priority order, never more than there are workers, so that the pool's own
+		first-in first-out queue never holds jobs.
+		"""
+		while True:
+			self.free_workers.acquire()
+			_, _, job_id, instance, solver, options, time_limit = self.queue.get()
+			with self.changed:
+				if job_id not in self.jobs or self.jobs[job_id]['status'] == 'cancelled':
+					self.free_workers.release()
+					continue
+				self.dispatched_job_ids.add(job_id)
+				self.jobs[job_id]['dispatched_time'] = time.time()
+			self.pool.apply_async(run_job, (job_id, instance, solver, options, time_limit, self.updates,
+											self.cancelled_job_ids, self.threads_per_worker), callback=self.finish_job)
+
+	def finish_job(self, result):
+		"""
+		Records the result of a dispatched job and frees its worker, unless the job was already given up.
+		"""
+		job_id, fields = result
+		with self.changed:
+			if job_id not in self.dispatched_job_ids:
+				return  # Its worker died
+			self.dispatched_job_ids.discard(job_id)
+			cancelled = self.cancelled_job_ids.pop(job_id, None)
+			if self.is_pending(job_id):  # Not already given up past its time limit
+				if cancelled:
+					fields['status'] = 'cancelled'
+				self.finish(job_id, fields)
+		self.free_workers.release()
+
+	def is_pending(self, job_id):
+		return job_id in self.jobs and self.jobs[job_id]['status'] not in ('done', 'failed', 'cancelled')
+
+	def finish(self, job_id, fields):
+		"""
+		Gives the job its final fields, and evicts the earliest finished jobs beyond the retention limit.
+		"""
+		with self.changed:
+			fields['finished_time'] = time.time()
+			self.update_job(job_id, fields)
+			self.finished_job_ids.append(job_id)
+			while len(self.finished_job_ids) > self.max_finished_jobs:
+				del self.jobs[self.finished_job_ids.popleft()]
+
+	def watch_workers(self):
+		"""
+		Fails dispatched jobs whose worker process died, and frees their workers: the pool never reports back on such
+		jobs. Jobs long past their time limit are failed and asked to stop, but keep their workers until they return,
+		so that the pool's own queue never holds jobs.
+		"""
+		while not self.closed:
+			time.sleep(WORKER_POLL_INTERVAL)
+			dead_job_ids = []
+			with self.changed:
+				for job_id in list(self.dispatched_job_ids):
+					job = self.jobs.get(job_id, {})
+					if job.get('worker_pid') is not None and not is_process_alive(job['worker_pid']):
+						self.dispatched_job_ids.discard(job_id)
+						self.cancelled_job_ids.pop(job_id, None)
+						if self.is_pending(job_id):
+							self.finish(job_id, {'status': 'failed',
+												 'error': 'worker process %s died' % job['worker_pid']})
+						dead_job_ids.append(job_id)
+					elif self.is_pending(job_id) and job['time_limit'] is not None and \
+							time.time() > job['dispatched_time'] + job['time_limit'] + JOB_TIMEOUT_GRACE_PERIOD:
+						self.cancelled_job_ids[job_id] = True
+						self.finish(job_id, {'status': 'failed', 'error': 'no result %s seconds past the time limit' %
+											 JOB_TIMEOUT_GRACE_PERIOD})
+
+			for _ in dead_job_ids:
+				self.free_workers.release()
+
+	def apply_updates(self):
+		while True:
+			try:
+				job_id, fields = self.updates.get()
+			except (EOFError, IOError):
+				return  # The service was closed
+			self.update_job(job_id, fields)
+
+	def update_job(self, job_id, fields):
+		with self.changed:
+			job = self.jobs.get(job_id)
+			if job is None:
+				return  # Late update for a job already evicted
+			if job['status'] in ('done', 'failed', 'cancelled') and 'finished_time' not in fields:
+				return  # Late incumbent from a job already finished
+			if fields.get('incumbent_objective') is not None and job.get('incumbent_objective') is not None and \
+					fields['incumbent_objective'] >= job['incumbent_objective']:
+				return
+			job.update(fields)
+			job['version'] += 1
+			self.changed.notify_all()
+
+	def cancel(self, job_id):
+		"""
+		Cancels a queued job at once. A dispatched job is asked to stop, and is recorded as cancelled once it does.
+		"""
+		with self.changed:
+			if job_id in self.dispatched_job_ids:
+				self.cancelled_job_ids[job_id] = True
+			elif self.jobs[job_id]['status'] == 'queued':
+				self.finish(job_id, {'status': 'cancelled'})
+
+	def get(self, job_id, since=None, wait=0):
+		"""
+		Returns a copy of the job record, first waiting up to wait seconds for its version to exceed since.
+		"""
+		deadline = time.time() + wait
+		with self.changed:
+			while since is not None and self.jobs[job_id]['version'] <= since and time.time() < deadline:
+				self.changed.wait(deadline - time.time())
+			return dict(self.jobs[job_id])
+
+	def summaries(self):
+		fields = ['job_id', 'status', 'priority', 'solver', 'submitted_time', 'incumbent_objective', 'objective',
+				  'version']
+		with self.changed:
+			return [{field: job.get(field) for field in fields} for job in self.jobs.itervalues()]
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+
+	def send_json(self, code, body):
+		response = json.dumps(body)
+		self.send_response(code)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(response)))
+		self.end_headers()
+		self.wfile.write(response)
+
+	def job_id(self):
+		path = urlparse.urlparse(self.path).path.rstrip('/').split('/')
+		return path[2] if len(path) == 3 and path[1] == 'jobs' else None
+
+	def do_POST(self):
+		if urlparse.urlparse(self.path).path.rstrip('/') != '/jobs':
+			return self.send_json(404, {'error': 'not found'})
+		try:
+			request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+			job_id = self.server.service.submit(request['instance'], request.get('solver', 'DCSN'),
+												request.get('options'), request.get('priority', 0),
+												request.get('time_limit'))
+		except (ValueError, KeyError) as error:
+			return self.send_json(400, {'error': str(error)})
+		self.send_json(200, {'job_id': job_id})
+
+	def do_GET(self):
+		if urlparse.urlparse(self.path).path.rstrip('/') == '/jobs':
+			return self.send_json(200, {'jobs': self.server.service.summaries()})
+
+		job_id = self.job_id()
+		if job_id not in self.server.service.jobs:
+			return self.send_json(404, {'error': 'no job %s' % job_id})
+		query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+		since = int(query['since'][0]) if 'since' in query else None
+		wait = float(query['wait'][0]) if 'wait' in query else 0
+		self.send_json(200, self.server.service.get(job_id, since, wait))
+
+	def do_DELETE(self):
+		job_id = self.job_id()
+		if job_id not in self.server.service.jobs:
+			return self.send_json(404, {'error': 'no job %s' % job_id})
+		self.server.service.cancel(job_id)
+		self.send_json(200, self.server.service.get(job_id))
+
+	def log_message(self, format, *args):
+		pass  # Keep the console for the service's own output
+
+
+class ServiceHTTPServer(ThreadingMixIn, HTTPServer):
+	daemon_threads = True
+
+
+def serve(host='127.0.0.1', port=8765, worker_count=None):
+	"""
+	Runs the solve service until interrupted, on worker_count worker processes (by default, one per CPU).
+	"""
+	service = SolveService(worker_count or multiprocessing.cpu_count())
+	server = ServiceHTTPServer((host, port), ServiceRequestHandler)
+	server.service = service
+	print('Solve service listening on http://%s:%s with %s workers' % (host, port, service.worker_count))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		service.close()
+
+
+def request_json(url, body=None, method=None):
+	request = urllib2.Request(url, json.dumps(body) if body is not None else None,
+							  {'Content-Type': 'application/json'})
+	if method is not None:
+		request.get_method = lambda: method
+	return json.load(urllib2.urlopen(request))
+
+
+def submit_job(url, graph, existence_for_node_condition, connectivity_demands, solver='DCSN', options=None,
+			   priority=0, time_limit=None):
+	"""
+	Submits a DCSN instance to the service at url (e.g. 'http://127.0.0.1:8765') and returns the job id.
+	"""
+	instance = DCSN_instance_to_dict(graph, existence_for_node_condition, connectivity_demands)
+	return request_json(url + '/jobs', {'instance': instance, 'solver': solver, 'options': options or {},
+										'priority': priority, 'time_limit': time_limit})['job_id']
+
+
+def get_job(url, job_id, since=None, wait=0):
+	"""
+	Returns the job record from the service at url, waiting up to wait seconds for a version newer than since.
+	"""
+	query = '?since=%s&wait=%s' % (since, wait) if since is not None else ''
+	return request_json('%s/jobs/%s%s' % (url, job_id, query))
+
+
+def cancel_job(url, job_id):
+	return request_json('%s/jobs/%s' % (url, job_id), method='DELETE')
+
+
+def main(arguments=None):
+	parser = argparse.ArgumentParser(description='Run the local DCSN solve service.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+	arguments = parser.parse_args(arguments)
+
+	serve(arguments.host, arguments.port, arguments.workers)
+
+
+if __name__ == "__main__":
+	main()
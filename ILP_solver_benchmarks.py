@@ -0,0 +1,261 @@
+"""
+This file benchmarks ILP solver scaling across graph size, condition count, demand count and node activity.
+
+Run a sweep and record the results:
+	python ILP_solver_benchmarks.py run --nodes 50 100 --conditions 2 5 --demands 2 5 --output results.json
+
+Compare the branch-and-bound trees of the single source formulations on the same instances:
+	python ILP_solver_benchmarks.py run --solvers single_source single_source_tight single_source_tight_cuts
+
+Compare two result files (exits with status 1 on regressions):
+	python ILP_solver_benchmarks.py compare results.json baseline.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+from Queue import Empty
+
+import networkx
+
+from ILP_solver.ILP_solver import solve_DCSN_instance, solve_single_source_DCSN_instance
+from ILP_solver.rounding import solve_DCSN_instance_by_rounding
+from ILP_solver.heuristic import solve_DCSN_instance_by_sharing
+from graph_tools.generation import create_sample_DCSN_instance, create_underlying_graph
+from graph_tools.verification import verify_DCSN_solution
+
+# Map from configuration name to (solver entry point, extra keyword arguments)
+SOLVER_CONFIGURATIONS = {
+	'DCSN': (solve_DCSN_instance, {}),
+	'single_source': (solve_single_source_DCSN_instance, {}),
+	'single_source_tight': (solve_single_source_DCSN_instance, {'formulation': 'tight'}),
+	'single_source_tight_cuts': (solve_single_source_DCSN_instance, {'formulation': 'tight', 'flow_cuts': True}),
+	'portfolio': (solve_DCSN_instance, {'portfolio': True}),
+	'rounding': (solve_DCSN_instance_by_rounding, {}),
+	'sharing': (solve_DCSN_instance_by_sharing, {}),
+	'DCSN_shared_paths_start': (solve_DCSN_instance, {'warm_start': 'shared_paths'}),
+}
+
+# Phases counted as solve time: optimization, the LP rounding of the bound-and-round mode, and the shared path
+# heuristic (standalone, or as a warm start)
+SOLVE_PHASES = ('heuristic', 'optimize', 'rounding')
+
+# Seconds between checks that a benchmark process is still alive
+SUBPROCESS_POLL_INTERVAL = 1
+
+# Parameters identifying a benchmark run; results with equal keys are compared against each other
+RUN_KEY_FIELDS = ('solver', 'node_count', 'condition_count', 'demands_count_per_source', 'node_active_prob', 'repeat')
+
+
+def run_benchmark(run):
+	"""
+	Given a run description (a dictionary of RUN_KEY_FIELDS plus 'seed' and 'average_degree'), generates the
+	instance, solves it and returns the run description extended with the measurements.
+	"""
+	random.seed(run['seed'])
+	record = dict(run)
+
+	graph = create_underlying_graph(run['node_count'], run['average_degree'])
+	candidate_sources = random.sample(graph.nodes(), min(100, graph.number_of_nodes()))
+	if not any(len(networkx.descendants(graph, v)) >= run['demands_count_per_source'] for v in candidate_sources):
+		record['status'] = 'skipped'  # No source can reach enough targets
+		return record
+
+	graph, existence_for_node_condition, connectivity_demands = create_sample_DCSN_instance(
+		graph, run['condition_count'], run['demands_count_per_source'], run['node_active_prob'], quiet=True)
+
+	solve, options = SOLVER_CONFIGURATIONS[run['solver']]
+	subgraph, metrics = solve(graph, existence_for_node_condition, connectivity_demands, quiet=True,
+							  return_metrics=True, **options)
+
+	wall_time_for_phase = metrics.wall_time_for_phase
+	record['status'] = 'solved' if subgraph is not None else 'unsolved'
+	record['build_time'] = sum(wall_time_for_phase.get(phase, 0.0) for phase in ('pruning', 'reduction', 'model_build'))
+	record['solve_time'] = sum(wall_time_for_phase.get(phase, 0.0) for phase in SOLVE_PHASES)
+	record['total_time'] = metrics.total_wall_time()
+	record['peak_rss_kb'] = metrics.peak_rss_kb
+	record['branch_and_bound_node_count'] = metrics.node_count
+	record['bound'] = metrics.bound
+	record['objective'] = None
+	if subgraph is not None:
+		violated_demands, record['objective'] = verify_DCSN_solution(graph, existence_for_node_condition,
+																	 connectivity_demands, subgraph)
+		record['violated_demand_count'] = len(violated_demands)
+	record['metrics'] = metrics.as_dict()
+
+	return record
+
+
+def run_benchmark_safely(run):
+	"""
+	Runs the benchmark, recording any error in the returned run record instead of raising it.
+	"""
+	try:
+		return run_benchmark(run)
+	except Exception as error:
+		return dict(run, status='error', error='%s: %s' % (type(error).__name__, error))
+
+
+def run_benchmark_in_subprocess(run):
+	"""
+	Runs the benchmark in a fresh process, so that peak memory and solver state are not shared between runs. If the
+	process dies without a record (e.g. killed for running out of memory), the run's status is 'crashed'.
+	"""
+	queue = multiprocessing.Queue()
+	process = multiprocessing.Process(target=lambda: queue.put(run_benchmark_safely(run)))
+	process.start()
+
+	record = None
+	while record is None:
+		try:
+			record = queue.get(timeout=SUBPROCESS_POLL_INTERVAL)
+		except Empty:
+			if process.is_alive():
+				continue
+			try:
+				record = queue.get(timeout=SUBPROCESS_POLL_INTERVAL)  # Put just before the process exited
+			except Empty:
+				record = dict(run, status='crashed', error='exit code %s' % process.exitcode)
+	process.join()
+
+	return record
+
+
+def run_benchmarks(node_counts, condition_counts, demands_counts_per_source, node_active_probs, solvers, repeats=1,
+				   seed=0, average_degree=4, isolate=True):
+	"""
+	Runs every solver configuration on every combination of parameters, repeats times each, and returns the list
+	of run records. Each (parameters, repeat) combination uses the same generated instance for every solver.
+	"""
+	records = []
+	for run_index, (node_count, condition_count, demands_count_per_source, node_active_prob, repeat) in enumerate(
+			itertools.product(node_counts, condition_counts, demands_counts_per_source, node_active_probs,
+							  range(repeats))):
+		for solver in solvers:
+			run = {
+				'solver': solver,
+				'node_count': node_count,
+				'condition_count': condition_count,
+				'demands_count_per_source': demands_count_per_source,
+				'node_active_prob': node_active_prob,
+				'repeat': repeat,
+				'seed': seed + run_index,
+				'average_degree': average_degree,
+			}
+			record = run_benchmark_in_subprocess(run) if isolate else run_benchmark_safely(run)
+			records.append(record)
+			print_record(record)
+
+	return records
+
+
+def print_record(record):
+	if record['status'] in ('skipped', 'error', 'crashed'):
+		print('%(solver)-15s n=%(node_count)-6s c=%(condition_count)-4s d=%(demands_count_per_source)-4s '
+			  'p=%(node_active_prob)-5s %(status)s %(error)s' % dict(record, error=record.get('error', '')))
+		return
+
+	print('%(solver)-15s n=%(node_count)-6s c=%(condition_count)-4s d=%(demands_count_per_source)-4s '
+		  'p=%(node_active_prob)-5s build %(build_time)8.3fs  solve %(solve_time)8.3fs  '
+		  'B&B nodes %(branch_and_bound_node_count)8s  rss %(peak_rss_kb)8s KB  objective %(objective)s' % record)
+
+
+def run_key(record):
+	return tuple(record[field] for field in RUN_KEY_FIELDS)
+
+
+def compare_results(records, baseline_records, tolerance=0.2, min_time=0.05):
+	"""
+	Given current and baseline run records, prints the time ratio of every matching run and returns the list
+	of regressions: runs whose total time grew by more than tolerance (ignoring runs faster than min_time
+	seconds in both), whose solution violates demands, whose objective changed, or which were solved in the
+	baseline only.
+	"""
+	baseline_record_for_key = {run_key(record): record for record in baseline_records}
+
+	regressions = []
+	print('%-60s %10s %10s %8s' % ('run', 'baseline', 'current', 'ratio'))
+	for record in records:
+		baseline_record = baseline_record_for_key.get(run_key(record))
+		if baseline_record is None or 'skipped' in (record['status'], baseline_record['status']):
+			continue
+
+		name = ' '.join('%s=%s' % (field, record[field]) for field in RUN_KEY_FIELDS)
+		if record['status'] != 'solved' or baseline_record['status'] != 'solved':
+			if baseline_record['status'] == 'solved':
+				regressions.append((name, 'no longer solved (%s)' % record['status']))
+			continue
+
+		ratio = record['total_time'] / max(baseline_record['total_time'], 1e-9)
+		print('%-60s %9.3fs %9.3fs %7.2fx' % (name, baseline_record['total_time'], record['total_time'], ratio))
+
+		if ratio > 1 + tolerance and max(record['total_time'], baseline_record['total_time']) > min_time:
+			regressions.append((name, 'total time %.2fx baseline' % ratio))
+		if record.get('violated_demand_count'):
+			regressions.append((name, '%s violated demands' % record['violated_demand_count']))
+		if abs(record['objective'] - baseline_record['objective']) > 1e-6:
+			regressions.append((name, 'objective %s, baseline %s' % (record['objective'], baseline_record['objective'])))
+
+	print('-----------------------------------------------------------------------')
+	print('%s regressions' % len(regressions))
+	for name, reason in regressions:
+		print('%s: %s' % (name, reason))
+
+	return regressions
+
+
+def write_results(path, records):
+	with open(path, 'w') as results_file:
+		json.dump({'results': records}, results_file, indent=1, sort_keys=True)
+
+
+def read_results(path):
+	with open(path) as results_file:
+		return json.load(results_file)['results']
+
+
+def main(arguments=None):
+	parser = argparse.ArgumentParser(description='Benchmark DCSN solvers on generated instances.')
+	subparsers = parser.add_subparsers(dest='command')
+
+	run_parser = subparsers.add_parser('run', help='run a parameter sweep')
+	run_parser.add_argument('--nodes', type=int, nargs='+', default=[50, 100, 200])
+	run_parser.add_argument('--conditions', type=int, nargs='+', default=[2, 5])
+	run_parser.add_argument('--demands', type=int, nargs='+', default=[2, 5])
+	run_parser.add_argument('--active-probs', type=float, nargs='+', default=[.75])
+	run_parser.add_argument('--solvers', nargs='+', default=sorted(SOLVER_CONFIGURATIONS),
+							choices=sorted(SOLVER_CONFIGURATIONS))
+	run_parser.add_argument('--repeats', type=int, default=1)
+	run_parser.add_argument('--seed', type=int, default=0)
+	run_parser.add_argument('--average-degree', type=float, default=4)
+	run_parser.add_argument('--no-isolate', action='store_true', help='run every solve in this process')
+	run_parser.add_argument('--output', default='bench_results.json')
+	run_parser.add_argument('--baseline', help='result file to compare against after the sweep')
+	run_parser.add_argument('--tolerance', type=float, default=0.2)
+
+	compare_parser = subparsers.add_parser('compare', help='compare a result file against a baseline')
+	compare_parser.add_argument('results')
+	compare_parser.add_argument('baseline')
+	compare_parser.add_argument('--tolerance', type=float, default=0.2)
+
+	arguments = parser.parse_args(arguments)
+
+	if arguments.command == 'run':
+		records = run_benchmarks(arguments.nodes, arguments.conditions, arguments.demands, arguments.active_probs,
+								 arguments.solvers, arguments.repeats, arguments.seed, arguments.average_degree,
+								 not arguments.no_isolate)
+		write_results(arguments.output, records)
+		if arguments.baseline is None:
+			return 0
+		baseline_records = read_results(arguments.baseline)
+	else:
+		records = read_results(arguments.results)
+		baseline_records = read_results(arguments.baseline)
+
+	return 1 if compare_results(records, baseline_records, arguments.tolerance) else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
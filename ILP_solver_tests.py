@@ -3,6 +3,20 @@ This file tests ILP solver functionality.
 """
 
 from ILP_solver.ILP_solver import *
+from graph_tools.feasibility import find_infeasible_demands
+from graph_tools.verification import verify_DCSN_solution
+from ILP_solver.metrics import SolveMetrics
+from ILP_solver.export import write_DCSN_model, read_DCSN_solution
+from graph_tools.instance_io import write_DCSN_instance, read_DCSN_instance, DCSN_instance_to_dict
+from graph_tools.visualization import render_DCSN_solution, LayoutCache
+from graph_tools.active_subgraph import ActiveSubgraphIndex
+from ILP_solver.heuristic import solve_DCSN_instance_by_sharing, shared_path_warm_start
+from ILP_solver.rounding import solve_DCSN_instance_by_rounding, usable_edges_for_demand_map, round_relaxation
+from ILP_solver import cli, portfolio, service
+from ILP_solver import checkpoint as checkpoint_module
+from ILP_solver.portfolio import solve_portfolio
+import os, tempfile, subprocess, sys, time, json, signal, multiprocessing, Queue
+import ILP_solver_benchmarks
 
 def test_solve_path_instance(feasible=True, detailed_output=False):
 	"""
@@ -90,11 +104,11 @@ def test_solve_anti_greedy_instance(detailed_output=False):
 	solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output)
 
 
-def test_solve_single_source_instance(detailed_output=False):
+def test_solve_single_source_instance(formulation='standard', flow_cuts=False, detailed_output=False):
 	"""
-	Tests the DCSN ILP solver on a simple path at two conditions .
+	Tests the single source DCSN ILP solver on a directed tree at two conditions, with the given formulation.
 	"""
-	print 'Testing single source instance'
+	print 'Testing single source instance with %s formulation' % formulation
 
 	graph = networkx.DiGraph()
 
@@ -116,7 +130,721 @@ def test_solve_single_source_instance(detailed_output=False):
 
 	connectivity_demands = [(1, 4, 1), (1, 3, 1), (1,4,2), (1,3,2)]
 
-	solve_single_source_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output)
+	solve_single_source_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, detailed_output,
+									  formulation=formulation, flow_cuts=flow_cuts)
+
+
+def test_solve_edge_varying_instance(detailed_output=False):
+	"""
+	Tests the DCSN ILP solver on an edge-varying instance, where every node always exists but the cheap shortcut
+	1 -> 3 only exists at the first condition.
+	"""
+	print 'Testing edge-varying instance'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=1)
+	graph.add_edge(2, 3, weight=1)
+	graph.add_edge(1, 3, weight=1)
+
+	existence_for_edge_condition = {(1,3,1): 1, (1,2,1): 1, (2,3,1): 1, (1,2,2): 1, (2,3,2): 1}
+
+	connectivity_demands = [(1,3,1), (1,3,2)]
+
+	solve_DCSN_instance(graph, None, connectivity_demands, detailed_output,
+						existence_for_edge_condition=existence_for_edge_condition)
+
+
+def test_solve_instance_by_rounding(detailed_output=False):
+	"""
+	Tests the bound-and-round mode on the anti-greedy instance.
+	"""
+	print 'Testing bound-and-round mode'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[1,2] = 0
+	existence_for_node_condition[2,2] = 0
+
+	connectivity_demands = [(1,2,1), (3,4,2)]
+
+	subgraph, metrics = solve_DCSN_instance_by_rounding(graph, existence_for_node_condition, connectivity_demands,
+														 detailed_output, return_metrics=True)
+	assert metrics.bound <= metrics.objective
+
+
+def test_solve_instance_by_sharing(detailed_output=False):
+	"""
+	Tests the shared path heuristic on an instance where routing each condition independently costs 16: the path
+	1 -> 2 -> 3 (weight 10) is the only one at condition 1, and the shortcut 1 -> 3 (weight 6) is the cheapest at
+	condition 2. Condition 2 is routed first, so only an improvement pass can reroute it along the bought path.
+	"""
+	print 'Testing shared path heuristic'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=5)
+	graph.add_edge(2, 3, weight=5)
+	graph.add_edge(1, 3, weight=6)
+
+	existence_for_edge_condition = {(1,2,1): 1, (2,3,1): 1, (1,2,2): 1, (2,3,2): 1, (1,3,2): 1}
+
+	connectivity_demands = [(1,3,2), (1,3,1)]
+
+	edges = shared_path_warm_start(graph, None, connectivity_demands, existence_for_edge_condition,
+								   improvement_passes=0, condition_order=[2,1])
+	assert sorted(edges) == [(1,2), (1,3), (2,3)]
+
+	subgraph, metrics = solve_DCSN_instance_by_sharing(graph, None, connectivity_demands, detailed_output,
+													   existence_for_edge_condition=existence_for_edge_condition,
+													   condition_order=[2,1], return_metrics=True)
+	violated_demands, objective = verify_DCSN_solution(graph, None, connectivity_demands, subgraph,
+													   existence_for_edge_condition)
+	print sorted(subgraph.edges()), objective
+	assert violated_demands == [] and objective == metrics.objective == 10
+
+
+def test_round_relaxation(detailed_output=False):
+	"""
+	Tests pruning of the relaxation and rounding with repair on the anti-greedy instance, from a fractional solution.
+	"""
+	print 'Testing relaxation rounding'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+	graph.add_edge(2, 5, weight=1)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[1,2] = 0
+	existence_for_node_condition[2,2] = 0
+
+	connectivity_demands = [(1,2,1), (3,4,2)]
+
+	# Edge 2 -> 5 is on no path of either demand
+	usable_edges_for_demand = usable_edges_for_demand_map(graph, existence_for_node_condition, connectivity_demands)
+	print usable_edges_for_demand
+	assert sorted(usable_edges_for_demand[0]) == [(1,2), (1,3), (3,4), (4,2)]
+	assert usable_edges_for_demand[1] == [(3,4)]
+
+	# Whatever the rounding, repair keeps the edge 3 -> 4 that the second demand needs, after which the path
+	# through it is free for the first demand
+	value_for_edge = {(1,2): 0.4, (1,3): 0.6, (3,4): 1.0, (4,2): 0.6}
+	active_subgraph_index = ActiveSubgraphIndex(graph, existence_for_node_condition)
+	edges = round_relaxation(graph, active_subgraph_index, connectivity_demands, value_for_edge)
+	subgraph = networkx.DiGraph()
+	subgraph.add_edges_from(edges)
+	violated_demands, objective = verify_DCSN_solution(graph, existence_for_node_condition, connectivity_demands,
+													   subgraph)
+	print sorted(edges), objective
+	assert violated_demands == [] and objective == 7
+
+
+def test_solve_metrics(detailed_output=False):
+	"""
+	Tests that solve metrics accumulate the wall and CPU time of repeated phases, including phases left by an error.
+	"""
+	print 'Testing solve metrics'
+
+	metrics = SolveMetrics()
+	with metrics.phase('pruning'):
+		time.sleep(0.05)
+	with metrics.phase('pruning'):
+		sum(xrange(10 ** 6))
+	try:
+		with metrics.phase('optimize'):
+			raise ValueError('solver failed')
+	except ValueError:
+		pass
+
+	metrics_dict = metrics.as_dict()
+	if detailed_output:
+		metrics.print_summary()
+	print metrics_dict['wall_time_for_phase']
+	assert sorted(metrics_dict['wall_time_for_phase']) == ['optimize', 'pruning']
+	assert metrics_dict['wall_time_for_phase']['pruning'] >= 0.05
+	assert metrics_dict['cpu_time_for_phase']['pruning'] > 0
+	assert abs(metrics_dict['total_wall_time'] - sum(metrics_dict['wall_time_for_phase'].values())) < 1e-9
+	assert metrics_dict['status'] is None and metrics_dict['objective'] is None and metrics_dict['peak_rss_kb'] > 0
+	json.dumps(metrics_dict)
+
+
+def test_compare_benchmark_results(detailed_output=False):
+	"""
+	Tests that comparing benchmark results reports slower, changed and no longer solved runs, but not fast or
+	skipped ones, and that a benchmark process killed mid-run is recorded as crashed.
+	"""
+	print 'Testing benchmark comparison'
+
+	def record(solver, status='solved', total_time=1.0, objective=10, **fields):
+		return dict({field: 0 for field in ILP_solver_benchmarks.RUN_KEY_FIELDS}, solver=solver, status=status,
+					total_time=total_time, objective=objective, **fields)
+
+	baseline_records = [record('steady'), record('slower'), record('changed'), record('crashed'),
+						record('fast', total_time=0.01), record('skipped')]
+	records = [record('steady', total_time=1.1), record('slower', total_time=2.0), record('changed', objective=11),
+			   record('crashed', status='crashed', objective=None), record('fast', total_time=0.04),
+			   record('skipped', status='skipped'), record('new')]
+
+	regressions = ILP_solver_benchmarks.compare_results(records, baseline_records)
+	assert sorted((name.split()[0], reason) for name, reason in regressions) == [
+		('solver=changed', 'objective 11, baseline 10'),
+		('solver=crashed', 'no longer solved (crashed)'),
+		('solver=slower', 'total time 2.00x baseline'),
+	]
+
+	# A solver killed by a signal (as by the out-of-memory killer) leaves a crashed record instead of hanging
+	ILP_solver_benchmarks.SOLVER_CONFIGURATIONS['killed'] = (
+		lambda *arguments, **options: os.kill(os.getpid(), signal.SIGKILL), {})
+	run = {'solver': 'killed', 'node_count': 20, 'condition_count': 1, 'demands_count_per_source': 1,
+		   'node_active_prob': .75, 'repeat': 0, 'seed': 0, 'average_degree': 4}
+	try:
+		crashed_record = ILP_solver_benchmarks.run_benchmark_in_subprocess(run)
+	finally:
+		del ILP_solver_benchmarks.SOLVER_CONFIGURATIONS['killed']
+	print crashed_record
+	assert crashed_record['status'] == 'crashed' and crashed_record['error'] == 'exit code -9'
+
+
+def test_portfolio_without_solver(detailed_output=False):
+	"""
+	Tests the parts of portfolio mode that need no optimization model: single source detection, the shared
+	incumbent, dropping a configuration whose process dies, and falling back on the shared incumbent when a
+	configuration does not report back before the time limit.
+	"""
+	print 'Testing portfolio process handling'
+
+	assert portfolio.is_single_source_instance([(1,2,1), (1,3,1), (2,3,2)])
+	assert not portfolio.is_single_source_instance([(1,2,1), (2,3,1)])
+
+	manager = multiprocessing.Manager()
+	shared_incumbent = portfolio.SharedIncumbent(manager)
+	assert shared_incumbent.best() == (float('inf'), None)
+	shared_incumbent.offer(10, [(1,2)])
+	shared_incumbent.offer(12, [(1,3)])
+	assert shared_incumbent.best() == (10, [(1,2)])
+	shared_incumbent.offer(7, [(1,3), (3,2)])
+	assert shared_incumbent.best() == (7, [(1,3), (3,2)])
+	manager.shutdown()
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[1,2] = 0
+	existence_for_node_condition[2,2] = 0
+
+	connectivity_demands = [(1,2,1), (3,4,2)]
+
+	def kill(*arguments, **options):
+		os.kill(os.getpid(), signal.SIGKILL)
+
+	def hang(*arguments, **options):
+		time.sleep(60)
+
+	portfolio.PORTFOLIO_CONFIGURATIONS['killed'] = (kill, {}, False)
+	portfolio.PORTFOLIO_CONFIGURATIONS['hanging'] = (hang, {}, False)
+	grace_period = portfolio.INCUMBENT_GRACE_PERIOD
+	portfolio.INCUMBENT_GRACE_PERIOD = 0.5
+	try:
+		# Without a time limit, the dead configuration must not keep the portfolio waiting
+		start_time = time.time()
+		subgraph = solve_portfolio(graph, existence_for_node_condition, connectivity_demands,
+								   configurations=['killed', 'sharing'], quiet=True)
+		print sorted(subgraph.edges()), time.time() - start_time
+		assert sorted(subgraph.edges()) == [(1,3), (3,4), (4,2)] and time.time() - start_time < 10
+
+		# A configuration that never reports back still leaves the warm start in the shared incumbent
+		subgraph, metrics = solve_portfolio(graph, existence_for_node_condition, connectivity_demands,
+											configurations=['hanging'], time_limit=0.5, quiet=True,
+											warm_start=[(1,2), (3,4)], return_metrics=True)
+		print sorted(subgraph.edges(data=True)), metrics.objective
+		assert sorted(subgraph.edges()) == [(1,2), (3,4)] and metrics.objective == 8
+
+		# A given index serves the feasibility check and the warm start, which fill its cache
+		index = ActiveSubgraphIndex(graph, existence_for_node_condition)
+		subgraph = solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, portfolio=['sharing'],
+									   warm_start='shared_paths', active_subgraph_index=index, quiet=True)
+		print len(index.cache)
+		assert sorted(subgraph.edges()) == [(1,3), (3,4), (4,2)] and len(index.cache) > 0
+		# Callbacks cannot reach configurations in other processes
+		try:
+			solve_DCSN_instance(graph, existence_for_node_condition, connectivity_demands, portfolio=True,
+								callback=lambda model, where: None)
+			assert False, 'portfolio mode accepted a callback'
+		except ValueError as error:
+			print error
+	finally:
+		del portfolio.PORTFOLIO_CONFIGURATIONS['killed']
+		del portfolio.PORTFOLIO_CONFIGURATIONS['hanging']
+		portfolio.INCUMBENT_GRACE_PERIOD = grace_period
+
+
+def test_solve_service(detailed_output=False):
+	"""
+	Tests the solve service in process with the shared path heuristic: jobs start in priority order, queued and
+	running jobs can be cancelled, a job whose worker process dies fails without losing its worker, a job given up
+	past its time limit holds its worker until it returns, and only the last finished jobs are kept.
+	"""
+	print 'Testing solve service'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	connectivity_demands = [(1,2,1), (3,4,2)]
+	instance = DCSN_instance_to_dict(graph, existence_for_node_condition, connectivity_demands)
+
+	def slow(graph, existence_for_node_condition, connectivity_demands, delay=0, callback=None, threads=None,
+			 **options):
+		time.sleep(delay)
+		return solve_DCSN_instance_by_sharing(graph, existence_for_node_condition, connectivity_demands, **options)
+
+	def crash(*arguments, **options):
+		os.kill(os.getpid(), signal.SIGKILL)
+
+	def record_options(graph, existence_for_node_condition, connectivity_demands, **options):
+		recorded_options.update(options)
+		return solve_DCSN_instance_by_sharing(graph, existence_for_node_condition, connectivity_demands,
+											  quiet=True, return_metrics=True)
+
+	def wait_until_finished(solve_service, job_id):
+		job = solve_service.get(job_id)
+		while job['status'] not in ('done', 'failed', 'cancelled'):
+			job = solve_service.get(job_id, since=job['version'], wait=10)
+		return job
+
+	service.SERVICE_SOLVERS['slow'] = slow
+	service.SERVICE_SOLVERS['crash'] = crash
+	service.SERVICE_SOLVERS['record_options'] = record_options
+	try:
+		# Model-based solvers get the worker's share of the threads, unless the job sets them
+		recorded_options = {}
+		job_id, fields = service.run_job('0', instance, 'record_options', {}, None, Queue.Queue(), {}, 3)
+		assert fields['status'] == 'done' and recorded_options['threads'] == 3 and 'callback' in recorded_options
+		recorded_options.clear()
+		service.run_job('0', instance, 'record_options', {'threads': 1}, None, Queue.Queue(), {}, 3)
+		assert recorded_options['threads'] == 1
+
+		solve_service = service.SolveService(1)  # Workers are forked with the test solvers registered
+		try:
+			# While the only worker is busy, later jobs queue up and start by priority
+			blocking_job_id = solve_service.submit(instance, 'slow', {'delay': 1})
+			job_id_for_priority = {priority: solve_service.submit(instance, 'sharing', priority=priority)
+								   for priority in [5, 1, 3]}
+			cancelled_job_id = solve_service.submit(instance, 'sharing', priority=2)
+			solve_service.cancel(cancelled_job_id)
+
+			jobs = [wait_until_finished(solve_service, job_id_for_priority[priority]) for priority in [1, 3, 5]]
+			print [(job['priority'], job['status'], job['objective']) for job in jobs]
+			assert all(job['status'] == 'done' and job['objective'] == 7 for job in jobs)
+			assert jobs[0]['started_time'] < jobs[1]['started_time'] < jobs[2]['started_time']
+			assert wait_until_finished(solve_service, blocking_job_id)['status'] == 'done'
+			job = solve_service.get(cancelled_job_id)
+			assert job['status'] == 'cancelled' and 'started_time' not in job
+
+			# A running job that is cancelled stays cancelled once its worker returns
+			running_job_id = solve_service.submit(instance, 'slow', {'delay': 1})
+			job = solve_service.get(running_job_id)
+			while job['status'] != 'running':
+				job = solve_service.get(running_job_id, since=job['version'], wait=10)
+			solve_service.cancel(running_job_id)
+			job = wait_until_finished(solve_service, running_job_id)
+			print job['status']
+			assert job['status'] == 'cancelled'
+
+			# A dead worker fails its job and frees its slot for the next job
+			crashed_job_id = solve_service.submit(instance, 'crash')
+			job = wait_until_finished(solve_service, crashed_job_id)
+			print job['status'], job['error']
+			assert job['status'] == 'failed' and 'died' in job['error']
+			job = wait_until_finished(solve_service, solve_service.submit(instance, 'sharing'))
+			assert job['status'] == 'done' and job['objective'] == 7
+
+			# A job given up past its time limit keeps its worker until it returns, so later jobs wait for it
+			grace_period = service.JOB_TIMEOUT_GRACE_PERIOD
+			service.JOB_TIMEOUT_GRACE_PERIOD = 0
+			try:
+				overdue_job_id = solve_service.submit(instance, 'slow', {'delay': 3}, time_limit=0)
+				overdue_job = wait_until_finished(solve_service, overdue_job_id)
+				job = wait_until_finished(solve_service, solve_service.submit(instance, 'sharing'))
+			finally:
+				service.JOB_TIMEOUT_GRACE_PERIOD = grace_period
+			print overdue_job['status'], overdue_job['error'], job['started_time'] - overdue_job['started_time']
+			assert overdue_job['status'] == 'failed' and 'time limit' in overdue_job['error']
+			assert job['status'] == 'done' and job['started_time'] >= overdue_job['started_time'] + 3
+
+			# Only the last finished jobs are kept
+			solve_service.max_finished_jobs = 2
+			last_job_id = solve_service.submit(instance, 'sharing')
+			wait_until_finished(solve_service, last_job_id)
+			print sorted(solve_service.jobs)
+			assert len(solve_service.jobs) == 2 and last_job_id in solve_service.jobs
+		finally:
+			solve_service.close()
+	finally:
+		del service.SERVICE_SOLVERS['slow']
+		del service.SERVICE_SOLVERS['crash']
+		del service.SERVICE_SOLVERS['record_options']
+
+
+def test_checkpoint_without_solver(detailed_output=False):
+	"""
+	Tests the parts of checkpointing that need no optimization model: checkpoint files are replaced atomically and
+	restore tuple edges, a finished checkpoint is resumed without solving, unknown solvers are rejected before
+	anything is written, and edge-varying instances are saved with their edge existence.
+	"""
+	print 'Testing checkpoint files'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(('a',1), ('b',1), weight=2)
+	graph.add_edge(('b',1), ('c',1), weight=3)
+	graph.add_edge(('a',1), ('c',1), weight=6)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	connectivity_demands = [(('a',1), ('c',1), 1)]
+
+	directory = tempfile.mkdtemp()
+	checkpoint = {'solver': 'DCSN', 'options': {}, 'edges': [[('a',1), ('b',1)], [('b',1), ('c',1)]],
+				  'objective': 5, 'bound': 5, 'finished': True}
+	checkpoint_module.write_checkpoint(directory, dict(checkpoint, objective=6))
+	checkpoint_module.write_checkpoint(directory, checkpoint)
+	assert sorted(os.listdir(directory)) == [checkpoint_module.CHECKPOINT_FILE_NAME]
+	read_checkpoint = checkpoint_module.read_checkpoint(directory)
+	print read_checkpoint
+	assert read_checkpoint['edges'] == [(('a',1), ('b',1)), (('b',1), ('c',1))] and read_checkpoint['objective'] == 5
+
+	# A finished solve is not repeated: its subgraph comes back with the instance's weights
+	write_DCSN_instance(os.path.join(directory, checkpoint_module.INSTANCE_FILE_NAME), graph,
+						existence_for_node_condition, connectivity_demands)
+	subgraph, metrics = checkpoint_module.resume_from_checkpoint(directory, quiet=True, return_metrics=True)
+	print sorted(subgraph.edges(data=True))
+	assert sorted(subgraph.edges(data=True)) == [(('a',1), ('b',1), {'weight': 2}), (('b',1), ('c',1), {'weight': 3})]
+	assert metrics is None
+
+	unused_directory = os.path.join(tempfile.mkdtemp(), 'run')
+	try:
+		checkpoint_module.solve_with_checkpoints(graph, existence_for_node_condition, connectivity_demands,
+												 unused_directory, solver='rounding', quiet=True)
+		assert False, 'checkpointing accepted an unknown solver'
+	except ValueError as error:
+		print error
+	assert not os.path.exists(unused_directory)
+
+	# Edge existence is saved with the instance, before the solve starts
+	existence_for_edge_condition = {(('a',1), ('c',1), 1): 1}
+	edge_varying_directory = os.path.join(tempfile.mkdtemp(), 'run')
+	try:
+		checkpoint_module.solve_with_checkpoints(graph, None, connectivity_demands, edge_varying_directory,
+												 quiet=True, existence_for_edge_condition=existence_for_edge_condition)
+	except GurobiError as error:
+		print error  # No license here; the instance is written either way
+	_, read_existence_for_node_condition, _, read_existence_for_edge_condition = read_DCSN_instance(
+		os.path.join(edge_varying_directory, checkpoint_module.INSTANCE_FILE_NAME), return_edge_existence=True)
+	assert read_existence_for_node_condition is None
+	assert read_existence_for_edge_condition == existence_for_edge_condition
+
+
+def test_find_infeasible_demands(detailed_output=False):
+	"""
+	Tests the feasibility check on a path at two conditions, where the target is missing at the second.
+	"""
+	print 'Testing infeasible demand detection'
+
+	graph = networkx.DiGraph()
+
+	graph.add_path([1,2,3,4])
+	for u,v in graph.edges_iter():
+		graph[u][v]['weight'] = 1
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[4,2] = 0
+
+	connectivity_demands = [(1,4,1), (1,3,2), (1,4,2), (3,1,1)]
+
+	infeasible_demands = find_infeasible_demands(graph, existence_for_node_condition, connectivity_demands)
+	print infeasible_demands
+	assert infeasible_demands == [(1,4,2), (3,1,1)]
+
+
+def test_edge_varying_feasibility(detailed_output=False):
+	"""
+	Tests the feasibility check and the verifier on an edge-varying instance, where every node always exists but the
+	shortcut 1 -> 3 only exists at the first condition.
+	"""
+	print 'Testing edge-varying feasibility'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=1)
+	graph.add_edge(2, 3, weight=1)
+	graph.add_edge(1, 3, weight=1)
+
+	existence_for_edge_condition = {(1,3,1): 1, (1,2,2): 1, (2,3,2): 1, (2,3,1): 1}
+
+	connectivity_demands = [(1,3,1), (1,3,2), (1,2,1)]
+
+	infeasible_demands = find_infeasible_demands(graph, None, connectivity_demands, existence_for_edge_condition)
+	print infeasible_demands
+	assert infeasible_demands == [(1,2,1)]
+
+	subgraph = networkx.DiGraph()
+	subgraph.add_path([1,3])
+	violated_demands, objective = verify_DCSN_solution(graph, None, connectivity_demands[:2], subgraph,
+													   existence_for_edge_condition)
+	print violated_demands, objective
+	assert violated_demands == [(1,3,2)] and objective == 1
+
+
+def test_verify_DCSN_solution(detailed_output=False):
+	"""
+	Tests the solution verifier on the anti-greedy instance, with the optimal solution and a broken one, and on
+	demands from a node to itself, which need no edge.
+	"""
+	print 'Testing solution verification'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+
+	existence_for_node_condition = {
+		(1,1): 1,
+		(2,1): 1,
+		(3,1): 1,
+		(4,1): 1,
+		(1,2): 0,
+		(2,2): 0,
+		(3,2): 1,
+		(4,2): 1
+	}
+
+	connectivity_demands = [(1,2,1), (3,4,2)]
+
+	subgraph = networkx.DiGraph()
+	subgraph.add_path([1,3,4,2])
+	violated_demands, objective = verify_DCSN_solution(graph, existence_for_node_condition, connectivity_demands,
+													   subgraph)
+	print violated_demands, objective
+	assert violated_demands == [] and objective == 7
+
+	subgraph.remove_edge(3,4)
+	subgraph.add_edge(1,2)
+	violated_demands, objective = verify_DCSN_solution(graph, existence_for_node_condition, connectivity_demands,
+													   subgraph)
+	print violated_demands, objective
+	assert violated_demands == [(3,4,2)] and objective == 5
+
+	# A demand from a node to itself is satisfied by the empty subgraph, unless the node is inactive
+	trivial_demands = [(1,1,1), (1,1,2), (3,3,2)]
+	violated_demands, objective = verify_DCSN_solution(graph, existence_for_node_condition, trivial_demands,
+													   networkx.DiGraph())
+	print violated_demands, objective
+	assert violated_demands == [(1,1,2)] and objective == 0
+	assert find_infeasible_demands(graph, existence_for_node_condition, trivial_demands) == [(1,1,2)]
+
+
+def test_active_subgraph_index(detailed_output=False):
+	"""
+	Tests the active subgraph index on the anti-greedy instance: activity, memoized shortest paths, and eviction.
+	"""
+	print 'Testing active subgraph index'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(1, 2, weight=3)
+	graph.add_edge(1, 3, weight=1)
+	graph.add_edge(3, 4, weight=5)
+	graph.add_edge(4, 2, weight=1)
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[1,2] = 0
+	existence_for_node_condition[2,2] = 0
+
+	index = ActiveSubgraphIndex(graph, existence_for_node_condition, max_cached_items=20)
+	assert index.is_node_active(3, 2) and not index.is_node_active(1, 2) and not index.is_node_active(1, 3)
+	assert sorted(index.active_edges(2)) == [(3,4)]
+	assert index.shortest_path(1, 2, 1) == [1,2]
+	assert index.shortest_path(1, 2, 1, weight=None) == [1,2]
+	assert index.shortest_path(3, 1, 1) is None
+
+	# Repeated queries are served from the cache
+	hit_count = index.cache.hit_count
+	assert index.shortest_path(1, 4, 1) == [1,3,4]
+	assert index.cache.hit_count == hit_count + 1
+
+	# Filling the cache evicts the least recently used values
+	for source in graph.nodes_iter():
+		index.shortest_path_tree(source, 1)
+	print len(index.cache), index.cache.size
+	assert index.cache.size <= 20 and ('nodes', 2) not in index.cache
+
+	# Feasibility checks reuse the index
+	assert find_infeasible_demands(graph, None, [(1,2,1), (3,1,2)], active_subgraph_index=index) == [(3,1,2)]
+
+
+def test_render_DCSN_solution(detailed_output=False):
+	"""
+	Tests rendering the anti-greedy solution per condition to a file, with a saved layout reused by a second render.
+	"""
+	print 'Testing solution rendering'
+
+	subgraph = networkx.DiGraph()
+	subgraph.add_path([1,3,4,2])
+
+	existence_for_node_condition = {(v,c): 1 for v in [1,2,3,4] for c in [1,2]}
+	existence_for_node_condition[1,2] = 0
+	existence_for_node_condition[2,2] = 0
+
+	connectivity_demands = [(1,2,1), (3,4,2)]
+
+	directory = tempfile.mkdtemp()
+	layout_path = os.path.join(directory, 'layout.json')
+	layout_cache = LayoutCache(layout_path)
+	for condition_path, per_condition in [('all.png', False), ('conditions.png', True)]:
+		render_DCSN_solution(os.path.join(directory, condition_path), subgraph, connectivity_demands,
+							 existence_for_node_condition, per_condition=per_condition, layout_cache=layout_cache)
+		assert os.path.getsize(os.path.join(directory, condition_path)) > 0
+
+	position_for_node = LayoutCache(layout_path).positions(subgraph)
+	print position_for_node
+	assert position_for_node == layout_cache.positions(subgraph)
+
+
+def test_command_line_interface(detailed_output=False):
+	"""
+	Tests generating, solving (with the shared path heuristic) and verifying an instance through the command-line
+	interface, that starting it loads no heavy module, and that solving with the heuristic never loads the
+	optimization library.
+	"""
+	print 'Testing command-line interface'
+
+	directory = tempfile.mkdtemp()
+	instance_path = os.path.join(directory, 'instance.json.gz')
+	solution_path = os.path.join(directory, 'solution.json')
+	assert cli.main(['generate', instance_path, '--nodes', '50', '--conditions', '2', '--demands', '3']) == 0
+	assert cli.main(['solve', instance_path, '--solver', 'sharing', '--quiet', '--output', solution_path]) == 0
+	assert cli.main(['verify', instance_path, solution_path]) == 0
+
+	loaded_modules = subprocess.check_output(
+		[sys.executable, '-c', 'import sys; from ILP_solver import cli; '
+							   'print [name for name in cli.HEAVY_MODULES if name in sys.modules]'],
+		cwd=os.path.dirname(os.path.abspath(__file__)))
+	print loaded_modules
+	assert loaded_modules.strip() == '[]'
+
+	timing = subprocess.check_output(
+		[sys.executable, '-m', 'ILP_solver.cli', '--timing', 'solve', instance_path, '--solver', 'sharing', '--quiet'],
+		cwd=os.path.dirname(os.path.abspath(__file__)))
+	print timing
+	assert 'loaded' in timing and 'gurobipy' not in timing
+
+
+def test_export_DCSN_model(detailed_output=False):
+	"""
+	Tests LP and MPS export of a path instance, with node existence and with edge existence only, and recovery of
+	a subgraph from a solution file.
+	"""
+	print 'Testing model export'
+
+	graph = networkx.DiGraph()
+
+	graph.add_path([1,2,3,4])
+	graph.add_edge(1,5)
+	for u,v in graph.edges_iter():
+		graph[u][v]['weight'] = 1
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[5,2] = 0
+
+	connectivity_demands = [(1,4,1), (1,3,2)]
+
+	directory = tempfile.mkdtemp()
+	for extension in ['lp', 'mps']:
+		path = os.path.join(directory, 'model.' + extension)
+		write_DCSN_model(path, graph, existence_for_node_condition, connectivity_demands)
+		model_text = open(path).read()
+		if detailed_output:
+			print model_text
+		# Edge 1 -> 5 is inactive at condition 2, so it only gets a flow variable for the first demand
+		edge_index = graph.edges().index((1,5))
+		assert 'f_%s_0' % edge_index in model_text and 'f_%s_1' % edge_index not in model_text
+
+	# Without node existence, the same edge can be switched off at condition 2 by edge existence instead
+	existence_for_edge_condition = {(u,v,c): 1 for u,v in graph.edges_iter() for c in [1,2]}
+	existence_for_edge_condition[1,5,2] = 0
+	path = os.path.join(directory, 'edge_varying_model.lp')
+	write_DCSN_model(path, graph, None, connectivity_demands, existence_for_edge_condition=existence_for_edge_condition)
+	model_text = open(path).read()
+	assert 'f_%s_0' % edge_index in model_text and 'f_%s_1' % edge_index not in model_text
+	path = os.path.join(directory, 'model.mps')
+
+	# Choose every edge variable of the path in a Gurobi-style solution file
+	solution_path = os.path.join(directory, 'model.sol')
+	with open(solution_path, 'w') as solution_file:
+		solution_file.write('# Objective value = 3\n')
+		for edge_index, edge in enumerate(graph.edges()):
+			solution_file.write('x_%s %s\n' % (edge_index, 0 if edge == (1,5) else 1))
+
+	subgraph = read_DCSN_solution(solution_path, path + '.edges')
+	print sorted(subgraph.edges())
+	assert sorted(subgraph.edges()) == [(1,2), (2,3), (3,4)]
+
+
+def test_write_read_DCSN_instance(detailed_output=False):
+	"""
+	Tests that an instance with tuple node names survives a round trip through the compact instance format, as does
+	an edge-varying instance without node existence.
+	"""
+	print 'Testing instance round trip'
+
+	graph = networkx.DiGraph()
+
+	graph.add_edge(('a',1), ('b',1), weight=2)
+	graph.add_edge(('b',1), ('c',1), weight=0.5)
+	graph.add_node(('d',1))
+
+	existence_for_node_condition = {(v,c): 1 for v in graph.nodes_iter() for c in [1,2]}
+	existence_for_node_condition[('b',1),2] = 0
+
+	connectivity_demands = [(('a',1), ('c',1), 1)]
+
+	path = os.path.join(tempfile.mkdtemp(), 'instance.json.gz')
+	write_DCSN_instance(path, graph, existence_for_node_condition, connectivity_demands)
+	read_graph, read_existence_for_node_condition, read_connectivity_demands = read_DCSN_instance(path)
+
+	assert sorted(read_graph.edges(data=True)) == sorted(graph.edges(data=True))
+	assert sorted(read_graph.nodes()) == sorted(graph.nodes())
+	assert read_existence_for_node_condition == existence_for_node_condition
+	assert read_connectivity_demands == connectivity_demands
+
+	existence_for_edge_condition = {(('a',1), ('b',1), 1): 1, (('b',1), ('c',1), 1): 1, (('b',1), ('c',1), 2): 0}
+	write_DCSN_instance(path, graph, None, connectivity_demands, existence_for_edge_condition)
+	_, read_existence_for_node_condition, _, read_existence_for_edge_condition = read_DCSN_instance(
+		path, return_edge_existence=True)
+	assert read_existence_for_node_condition is None
+	assert read_existence_for_edge_condition == {edge_condition: 1 for edge_condition, exists in
+												 existence_for_edge_condition.iteritems() if exists}
 
 
 if __name__ == "__main__":
@@ -130,6 +858,30 @@ if __name__ == "__main__":
 		#(test_solve_random_instance, {'node_count': 100, 'tree_count': 10, 'tree_span': 20}),
 
 		 #(test_solve_anti_greedy_instance, {}),
+
+		 #(test_solve_single_source_instance, {'formulation': 'standard'}),
+		 #(test_solve_single_source_instance, {'formulation': 'tight'}),
+		 #(test_solve_single_source_instance, {'formulation': 'tight', 'flow_cuts': True}),
+
+		 #(test_solve_edge_varying_instance, {}),
+
+		 #(test_solve_instance_by_rounding, {}),
+
+		(test_solve_instance_by_sharing, {}),
+		(test_round_relaxation, {}),
+		(test_solve_metrics, {}),
+		(test_compare_benchmark_results, {}),
+		(test_portfolio_without_solver, {}),
+		(test_solve_service, {}),
+		(test_checkpoint_without_solver, {}),
+		(test_find_infeasible_demands, {}),
+		(test_edge_varying_feasibility, {}),
+		(test_verify_DCSN_solution, {}),
+		(test_active_subgraph_index, {}),
+		(test_render_DCSN_solution, {}),
+		(test_command_line_interface, {}),
+		(test_export_DCSN_model, {}),
+		(test_write_read_DCSN_instance, {}),
 	]
 
 	for test, kwargs in tests:
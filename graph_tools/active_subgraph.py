@@ -0,0 +1,217 @@
+"""
+This file implements an index of the active subgraph of every condition of a DCSN instance, built once and shared
+by the pipeline stages that query it (feasibility checking, pruning, heuristics). Per-condition node and edge
+bitmasks answer activity queries in constant time; active adjacency and shortest-path trees are computed on first
+use and memoized in a least recently used cache of bounded size, so repeated queries cost time proportional to
+their output.
+"""
+import heapq
+from collections import OrderedDict
+
+from graph_tools.feasibility import bit_for_condition_map, active_mask_for_node_map, active_mask_for_edge_map
+
+
+class LRUCache(object):
+	"""
+	Dictionary holding at most capacity items in total over its entries, where an entry's item count is given by
+	size_for_value; once full, the least recently used entries are evicted (but never the entry just added).
+	"""
+
+	def __init__(self, capacity, size_for_value=len):
+		self.capacity = capacity
+		self.size_for_value = size_for_value
+		self.entries = OrderedDict()  # Key to (value, size), from least to most recently used
+		self.size = 0
+		self.hit_count = 0
+		self.miss_count = 0
+
+	def __contains__(self, key):
+		return key in self.entries
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get(self, key, default=None):
+		if key not in self.entries:
+			self.miss_count += 1
+			return default
+		self.hit_count += 1
+		entry = self.entries.pop(key)
+		self.entries[key] = entry
+		return entry[0]
+
+	def put(self, key, value):
+		if key in self.entries:
+			self.size -= self.entries.pop(key)[1]
+		size = self.size_for_value(value)
+		self.entries[key] = (value, size)
+		self.size += size
+
+		while self.size > self.capacity and len(self.entries) > 1:
+			_, (_, evicted_size) = self.entries.popitem(last=False)
+			self.size -= evicted_size
+
+	def clear(self):
+		self.entries.clear()
+		self.size = 0
+
+
+def cached_value_size(value):
+	"""
+	Returns the number of items held by a cached value: the length of a list, or the total length of a
+	dictionary's keys and list values, or of every member of a tuple.
+	"""
+	if isinstance(value, tuple):
+		return sum(cached_value_size(member) for member in value)
+	if isinstance(value, dict):
+		return len(value) + sum(len(item) for item in value.itervalues() if isinstance(item, list))
+	return len(value)
+
+
+class ActiveSubgraphIndex(object):
+	"""
+	Index of the active subgraph of each condition of a DCSN instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}, or None if all nodes always exist
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}, where missing entries
+		  do not exist
+
+	The conditions indexed are those given, or else those appearing in the existence dictionaries; other conditions
+	have no active nodes. Building the index scans the existence dictionaries once. Memoized values hold at most
+	max_cached_items nodes and edges in total.
+	"""
+
+	def __init__(self, graph, existence_for_node_condition, existence_for_edge_condition=None, conditions=None,
+				 max_cached_items=10 ** 6):
+		if conditions is None:
+			conditions = set()
+			if existence_for_node_condition is not None:
+				conditions.update(condition for node, condition in existence_for_node_condition)
+			if existence_for_edge_condition is not None:
+				conditions.update(condition for u, v, condition in existence_for_edge_condition)
+
+		self.graph = graph
+		self.bit_for_condition = bit_for_condition_map(conditions)
+		self.active_mask_for_node = active_mask_for_node_map(graph, existence_for_node_condition,
+															 self.bit_for_condition)
+		self.active_mask_for_edge = None
+		if existence_for_edge_condition is not None:
+			self.active_mask_for_edge = active_mask_for_edge_map(graph, existence_for_edge_condition,
+																 self.bit_for_condition)
+		self.cache = LRUCache(max_cached_items, cached_value_size)
+
+	def conditions(self):
+		return self.bit_for_condition.keys()
+
+	def is_node_active(self, node, condition):
+		return bool(self.active_mask_for_node.get(node, 0) & self.bit_for_condition.get(condition, 0))
+
+	def is_edge_active(self, u, v, condition):
+		bit = self.bit_for_condition.get(condition, 0)
+		return bool(self.active_mask_for_node.get(u, 0) & self.active_mask_for_node.get(v, 0) & bit and
+					(self.active_mask_for_edge is None or self.active_mask_for_edge.get((u, v), 0) & bit))
+
+	def memoized(self, key, compute):
+		value = self.cache.get(key)
+		if value is None:
+			value = compute()
+			self.cache.put(key, value)
+		return value
+
+	def active_nodes(self, condition):
+		"""
+		Returns the list of nodes active at the condition.
+		"""
+		def compute():
+			bit = self.bit_for_condition.get(condition, 0)
+			return [node for node, mask in self.active_mask_for_node.iteritems() if mask & bit]
+
+		return self.memoized(('nodes', condition), compute)
+
+	def active_successors(self, condition):
+		"""
+		Returns a dictionary from every node active at the condition to the list of its successors through edges
+		active at the condition.
+		"""
+		def compute():
+			return {u: [v for v in self.graph.successors_iter(u) if self.is_edge_active(u, v, condition)]
+					for u in self.active_nodes(condition)}
+
+		return self.memoized(('successors', condition), compute)
+
+	def active_predecessors(self, condition):
+		"""
+		Returns a dictionary from every node active at the condition to the list of its predecessors through edges
+		active at the condition.
+		"""
+		def compute():
+			return {v: [u for u in self.graph.predecessors_iter(v) if self.is_edge_active(u, v, condition)]
+					for v in self.active_nodes(condition)}
+
+		return self.memoized(('predecessors', condition), compute)
+
+	def active_edges(self, condition):
+		"""
+		Returns the list of edges (u, v) active at the condition.
+		"""
+		def compute():
+			return [(u, v) for u, successors in self.active_successors(condition).iteritems() for v in successors]
+
+		return self.memoized(('edges', condition), compute)
+
+	def shortest_path_tree(self, source, condition, weight='weight'):
+		"""
+		Returns a pair of dictionaries from every node reachable from the source in the active subgraph of the
+		condition to its distance from the source, and to its predecessor on a shortest path (None for the source).
+		Edge lengths are the given edge attribute, 1 if weight is None, or weight(u, v) if weight is a function;
+		trees for a function are not memoized, as its lengths may change between queries.
+		"""
+		def compute():
+			distance_for_node = {}
+			predecessor_for_node = {}
+			if not self.is_node_active(source, condition):
+				return distance_for_node, predecessor_for_node
+
+			successors_for_node = self.active_successors(condition)
+			tentative_distance_for_node = {source: 0}
+			predecessor_for_node[source] = None
+			heap = [(0, source)]
+			while heap:
+				distance, u = heapq.heappop(heap)
+				if u in distance_for_node:
+					continue
+				distance_for_node[u] = distance
+				for v in successors_for_node[u]:
+					if v in distance_for_node:
+						continue
+					if callable(weight):
+						length = weight(u, v)
+					else:
+						length = self.graph[u][v][weight] if weight is not None else 1
+					new_distance = distance + length
+					if v not in tentative_distance_for_node or new_distance < tentative_distance_for_node[v]:
+						tentative_distance_for_node[v] = new_distance
+						predecessor_for_node[v] = u
+						heapq.heappush(heap, (new_distance, v))
+
+			return distance_for_node, predecessor_for_node
+
+		if callable(weight):
+			return compute()
+		return self.memoized(('tree', source, condition, weight), compute)
+
+	def shortest_path(self, source, target, condition, weight='weight'):
+		"""
+		Returns the list of nodes on a shortest source -> target path in the active subgraph of the condition, or
+		None if there is none. Only the first query from a (source, condition) pair runs Dijkstra.
+		"""
+		distance_for_node, predecessor_for_node = self.shortest_path_tree(source, condition, weight)
+		if target not in distance_for_node:
+			return None
+
+		path = [target]
+		while predecessor_for_node[path[-1]] is not None:
+			path.append(predecessor_for_node[path[-1]])
+		path.reverse()
+
+		return path
@@ -0,0 +1,196 @@
+"""
+This file implements fast feasibility checks for DCSN instances.
+"""
+
+
+def bit_for_condition_map(conditions):
+	"""
+	Given an iterable of conditions, returns a dictionary from condition to a distinct bit (a power of two).
+	"""
+	return {condition: 1 << index for index, condition in enumerate(conditions)}
+
+
+def active_mask_for_node_map(graph, existence_for_node_condition, bit_for_condition):
+	"""
+	Given a graph, an existence dictionary and a map from condition to bit, returns a dictionary from node to
+	the bitmask of conditions at which the node is active. If the existence dictionary is None, every node is
+	active at every condition.
+	"""
+	if existence_for_node_condition is None:
+		all_conditions_mask = sum(bit_for_condition.itervalues())
+		return {node: all_conditions_mask for node in graph.nodes_iter()}
+
+	active_mask_for_node = {node: 0 for node in graph.nodes_iter()}
+
+	# Scan whichever is smaller: the existence dictionary, or the graph's nodes at the given conditions
+	if len(existence_for_node_condition) <= len(active_mask_for_node) * len(bit_for_condition):
+		for (node, condition), exists in existence_for_node_condition.iteritems():
+			if exists and condition in bit_for_condition and node in active_mask_for_node:
+				active_mask_for_node[node] |= bit_for_condition[condition]
+	else:
+		for node in active_mask_for_node:
+			for condition, bit in bit_for_condition.iteritems():
+				if existence_for_node_condition.get((node, condition), 0):
+					active_mask_for_node[node] |= bit
+
+	return active_mask_for_node
+
+
+def active_mask_for_edge_map(graph, existence_for_edge_condition, bit_for_condition):
+	"""
+	Given a graph, a dictionary from (u, v, condition) to existence and a map from condition to bit, returns a
+	dictionary from edge (u, v) to the bitmask of conditions at which the edge is active. Edges without any
+	entry may be missing from the result.
+	"""
+	active_mask_for_edge = {}
+
+	# Scan whichever is smaller: the existence dictionary, or the graph's edges at the given conditions
+	if len(existence_for_edge_condition) <= graph.number_of_edges() * len(bit_for_condition):
+		for (u, v, condition), exists in existence_for_edge_condition.iteritems():
+			if exists and condition in bit_for_condition:
+				active_mask_for_edge[u, v] = active_mask_for_edge.get((u, v), 0) | bit_for_condition[condition]
+	else:
+		for u, v in graph.edges_iter():
+			for condition, bit in bit_for_condition.iteritems():
+				if existence_for_edge_condition.get((u, v, condition), 0):
+					active_mask_for_edge[u, v] = active_mask_for_edge.get((u, v), 0) | bit
+
+	return active_mask_for_edge
+
+
+def condition_masks(graph, existence_for_node_condition, conditions, existence_for_edge_condition=None,
+					active_subgraph_index=None):
+	"""
+	Returns (bit for condition map, active mask for node map, active mask for edge map or None) for the given
+	conditions, taken from active_subgraph_index (an ActiveSubgraphIndex of the instance) if given, which already
+	holds them for all of its conditions, or else computed from the existence dictionaries.
+	"""
+	if active_subgraph_index is not None:
+		return active_subgraph_index.bit_for_condition, active_subgraph_index.active_mask_for_node, \
+			active_subgraph_index.active_mask_for_edge
+
+	bit_for_condition = bit_for_condition_map(conditions)
+	active_mask_for_node = active_mask_for_node_map(graph, existence_for_node_condition, bit_for_condition)
+	active_mask_for_edge = None
+	if existence_for_edge_condition is not None:
+		active_mask_for_edge = active_mask_for_edge_map(graph, existence_for_edge_condition, bit_for_condition)
+
+	return bit_for_condition, active_mask_for_node, active_mask_for_edge
+
+
+def reachable_mask_for_node_map(graph, source, source_mask, active_mask_for_node, active_mask_for_edge=None,
+								reverse=False):
+	"""
+	Given a graph, a source node, the bitmask of conditions to explore from the source and the active condition
+	bitmask of every node (and optionally of every edge, where missing edges are never active), returns a
+	dictionary from node to the bitmask of conditions at which the node is reachable from the source through
+	active nodes and edges. If reverse is set, edges are followed backwards instead, so the result holds the
+	conditions at which each node reaches the source.
+
+	A single traversal serves every condition: each node only forwards the condition bits it has newly gained,
+	so every (node, condition) pair is settled at most once.
+	"""
+	reachable_mask_for_node = {source: source_mask}
+	pending_mask_for_node = {source: source_mask}
+	stack = [source]
+
+	while stack:
+		u = stack.pop()
+		pending_mask = pending_mask_for_node.pop(u)
+
+		for v in (graph.predecessors_iter(u) if reverse else graph.successors_iter(u)):
+			new_mask = pending_mask & active_mask_for_node[v] & ~reachable_mask_for_node.get(v, 0)
+			if active_mask_for_edge is not None:
+				new_mask &= active_mask_for_edge.get((v, u) if reverse else (u, v), 0)
+			if new_mask:
+				reachable_mask_for_node[v] = reachable_mask_for_node.get(v, 0) | new_mask
+				if v in pending_mask_for_node:
+					pending_mask_for_node[v] |= new_mask
+				else:
+					pending_mask_for_node[v] = new_mask
+					stack.append(v)
+
+	return reachable_mask_for_node
+
+
+def find_infeasible_demands(graph, existence_for_node_condition, connectivity_demands,
+							existence_for_edge_condition=None, active_subgraph_index=None):
+	"""
+	Given a DCSN instance:
+		- A directed graph
+		- A dictionary from (node, condition) to existence {True, False}, or None if all nodes always exist
+		- A list of connectivity demands (source, target, condition)
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}, where missing
+		  entries do not exist
+
+	returns the list of demands (source, target, condition) for which no source -> target path exists in the
+	active subgraph of the condition, in the order they appear in connectivity_demands.
+
+	Runs one bitmask reachability traversal per distinct source, covering all of its conditions at once. If an
+	ActiveSubgraphIndex of the instance is given, its masks are used instead of scanning the existence dictionaries.
+	"""
+	conditions = set(condition for source, target, condition in connectivity_demands)
+	bit_for_condition, active_mask_for_node, active_mask_for_edge = condition_masks(
+		graph, existence_for_node_condition, conditions, existence_for_edge_condition, active_subgraph_index)
+
+	# Group the demanded conditions by source
+	demanded_mask_for_source = {}
+	for source, target, condition in connectivity_demands:
+		demanded_mask_for_source[source] = demanded_mask_for_source.get(source, 0) | bit_for_condition.get(condition, 0)
+
+	# Explore each source once, only at conditions where it is both demanded and active
+	reachable_mask_for_source_node = {}
+	for source, demanded_mask in demanded_mask_for_source.iteritems():
+		if source not in active_mask_for_node:
+			reachable_mask_for_source_node[source] = {}
+			continue
+		source_mask = demanded_mask & active_mask_for_node[source]
+		reachable_mask_for_source_node[source] = reachable_mask_for_node_map(graph, source, source_mask,
+																			 active_mask_for_node, active_mask_for_edge)
+
+	infeasible_demands = []
+	for source, target, condition in connectivity_demands:
+		if not reachable_mask_for_source_node[source].get(target, 0) & bit_for_condition.get(condition, 0):
+			infeasible_demands.append((source, target, condition))
+
+	return infeasible_demands
+
+
+def print_infeasible_demands(infeasible_demands):
+	print('Infeasible demands (source -> target at condition):')
+	for source, target, condition in infeasible_demands:
+		print('%s -> %s at condition %s' % (source, target, condition))
+
+
+def screen_connectivity_demands(graph, existence_for_node_condition, connectivity_demands,
+								drop_infeasible_demands=False, quiet=False, existence_for_edge_condition=None,
+								active_subgraph_index=None):
+	"""
+	Given a DCSN problem instance:
+		- A directed graph
+		- A dictionary from (node, condition) to existence {True, False}
+		- A list of connectivity demands (source, target, condition)
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}
+
+	checks every demand for a source -> target path in the active subgraph of its condition, and prints any
+	infeasible demands. Returns the demands to solve: all of them if the instance is feasible, the feasible
+	ones if drop_infeasible_demands is set, and None otherwise. An ActiveSubgraphIndex of the instance may be given
+	to reuse its masks.
+	"""
+	infeasible_demands = find_infeasible_demands(graph, existence_for_node_condition, connectivity_demands,
+												 existence_for_edge_condition, active_subgraph_index)
+	if not infeasible_demands:
+		return connectivity_demands
+
+	if not quiet:
+		print('-----------------------------------------------------------------------')
+		print_infeasible_demands(infeasible_demands)
+	if not drop_infeasible_demands:
+		if not quiet:
+			print('Instance is infeasible.')
+		return None
+
+	infeasible_demand_set = set(infeasible_demands)
+	if not quiet:
+		print('Dropped %s infeasible demands.' % len(infeasible_demand_set))
+	return [demand for demand in connectivity_demands if demand not in infeasible_demand_set]
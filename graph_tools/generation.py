@@ -4,15 +4,31 @@ This file implements algorithms for generating sample graphs.
 import networkx
 import random
 import pickle
+import sys
 
 
-def create_sample_DCSN_instance(graph, condition_count=100, demands_count_per_source = 100, node_active_prob=.75):
+def create_underlying_graph(node_count, average_degree=4, max_weight=10):
+	"""
+	Returns a random directed graph on node_count nodes with the given expected out-degree, and with integer
+	attribute 'weight' drawn uniformly from 1,...,max_weight on all edges.
+	"""
+	edge_prob = min(1.0, float(average_degree) / max(node_count - 1, 1))
+	graph = networkx.gnp_random_graph(node_count, edge_prob, seed=random.randint(0, sys.maxint), directed=True)
+	for u, v in graph.edges_iter():
+		graph[u][v]['weight'] = random.randint(1, max_weight)
+
+	return graph
+
+
+def create_sample_DCSN_instance(graph, condition_count=100, demands_count_per_source = 100, node_active_prob=.75,
+								quiet=False):
 	"""
 	Generates a sample DCSN problem instance:
 		- A directed graph with attribute 'weight' on all edges
 		- Number of conditions to generate
 		- Number of demands per node
 		- Probability a node is active in any condition
+		- Whether to suppress progress output
 
 	Returns:
 		- A directed graph with attribute 'weight' on all edges
@@ -41,7 +57,8 @@ def create_sample_DCSN_instance(graph, condition_count=100, demands_count_per_so
 		reachable_nodes_from_source = networkx.descendants(graph, source)
 
 	for condition in range(condition_count):
-		print "Processing generated graph for c =", condition
+		if not quiet:
+			print "Processing generated graph for c =", condition
 
 		existence_for_node_condition[(source, condition)] = 1
 
@@ -64,7 +81,8 @@ def create_sample_DCSN_instance(graph, condition_count=100, demands_count_per_so
 	for x,y in edges.items():
 		total += y
 
-	print "Total Cost of SP solution:", total
+	if not quiet:
+		print "Total Cost of SP solution:", total
 	return graph, existence_for_node_condition, connectivity_demands
 
 
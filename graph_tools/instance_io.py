@@ -0,0 +1,148 @@
+"""
+This file implements reading and writing DCSN instances in a compact JSON format:
+	{
+		"edges": [[u, v, weight], ...],
+		"nodes": [isolated nodes, ...],
+		"active_conditions": [[node, [conditions at which the node exists]], ...] (null if nodes always exist),
+		"active_edge_conditions": [[u, v, [conditions at which the edge exists]], ...] (only if edges vary),
+		"conditions": [every condition],
+		"demands": [[source, target, condition], ...]
+	}
+Solutions are stored in the same way, as {"edges": [[u, v, weight], ...]} plus any summary fields (objective,
+solver, metrics).
+Files whose name ends with '.gz' are gzip-compressed.
+"""
+import gzip
+import json
+
+import networkx
+
+
+def tuples_from_lists(value):
+	"""
+	Restores tuple node names and conditions, which JSON stores as lists.
+	"""
+	return tuple(tuples_from_lists(item) for item in value) if isinstance(value, list) else value
+
+
+def open_instance_file(path, mode):
+	return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+def DCSN_instance_to_dict(graph, existence_for_node_condition, connectivity_demands,
+						  existence_for_edge_condition=None):
+	"""
+	Given a DCSN instance, with node existence None if every node always exists and optionally a sparse dictionary
+	from (u, v, condition) to edge existence, returns its compact, JSON-serializable form.
+	"""
+	conditions = set(condition for source, target, condition in connectivity_demands)
+
+	active_conditions = None
+	if existence_for_node_condition is not None:
+		conditions.update(condition for (node, condition) in existence_for_node_condition)
+		active_conditions_for_node = {}
+		for (node, condition), exists in existence_for_node_condition.iteritems():
+			if exists:
+				active_conditions_for_node.setdefault(node, []).append(condition)
+		active_conditions = [[node, node_conditions] for node, node_conditions in
+							 active_conditions_for_node.iteritems()]
+
+	instance = {
+		'edges': [[u, v, graph[u][v]['weight']] for u, v in graph.edges_iter()],
+		'nodes': [node for node in graph.nodes_iter() if graph.degree(node) == 0],
+		'active_conditions': active_conditions,
+		'demands': [list(demand) for demand in connectivity_demands],
+	}
+
+	if existence_for_edge_condition is not None:
+		conditions.update(condition for (u, v, condition) in existence_for_edge_condition)
+		active_conditions_for_edge = {}
+		for (u, v, condition), exists in existence_for_edge_condition.iteritems():
+			if exists:
+				active_conditions_for_edge.setdefault((u, v), []).append(condition)
+		instance['active_edge_conditions'] = [[u, v, edge_conditions] for (u, v), edge_conditions in
+											  active_conditions_for_edge.iteritems()]
+
+	instance['conditions'] = list(conditions)
+	return instance
+
+
+def DCSN_instance_from_dict(instance, return_edge_existence=False):
+	"""
+	Given the compact form of a DCSN instance, returns:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {1, 0}, with an entry for every node and condition, or
+		  None if every node always exists
+		- A list of connectivity demands (source, target, condition)
+		- If return_edge_existence is set, a sparse dictionary from (u, v, condition) to existence {1}, or None if
+		  edges do not vary
+	"""
+	graph = networkx.DiGraph()
+	graph.add_nodes_from(tuples_from_lists(node) for node in instance['nodes'])
+	for u, v, weight in instance['edges']:
+		graph.add_edge(tuples_from_lists(u), tuples_from_lists(v), weight=weight)
+
+	existence_for_node_condition = None
+	if instance['active_conditions'] is not None:
+		conditions = [tuples_from_lists(condition) for condition in instance['conditions']]
+		existence_for_node_condition = {(node, condition): 0 for node in graph.nodes_iter()
+										for condition in conditions}
+		for node, active_conditions in instance['active_conditions']:
+			node = tuples_from_lists(node)
+			for condition in active_conditions:
+				existence_for_node_condition[node, tuples_from_lists(condition)] = 1
+
+	connectivity_demands = [tuples_from_lists(demand) for demand in instance['demands']]
+
+	if not return_edge_existence:
+		return graph, existence_for_node_condition, connectivity_demands
+
+	existence_for_edge_condition = None
+	if 'active_edge_conditions' in instance:
+		existence_for_edge_condition = {}
+		for u, v, active_conditions in instance['active_edge_conditions']:
+			u, v = tuples_from_lists(u), tuples_from_lists(v)
+			for condition in active_conditions:
+				existence_for_edge_condition[u, v, tuples_from_lists(condition)] = 1
+
+	return graph, existence_for_node_condition, connectivity_demands, existence_for_edge_condition
+
+
+def write_DCSN_instance(path, graph, existence_for_node_condition, connectivity_demands,
+						existence_for_edge_condition=None):
+	with open_instance_file(path, 'wb') as instance_file:
+		json.dump(DCSN_instance_to_dict(graph, existence_for_node_condition, connectivity_demands,
+										existence_for_edge_condition), instance_file)
+
+
+def read_DCSN_instance(path, return_edge_existence=False):
+	"""
+	Reads a DCSN instance written by write_DCSN_instance; see DCSN_instance_from_dict for the return value.
+	"""
+	with open_instance_file(path, 'rb') as instance_file:
+		return DCSN_instance_from_dict(json.load(instance_file), return_edge_existence)
+
+
+def write_solution_subgraph(path, subgraph, **fields):
+	"""
+	Writes a solution subgraph, and any JSON-serializable summary fields, to path.
+	"""
+	solution = dict(fields)
+	solution['edges'] = [[u, v, data.get('weight')] for u, v, data in subgraph.edges_iter(data=True)]
+	with open_instance_file(path, 'wb') as solution_file:
+		json.dump(solution, solution_file)
+
+
+def read_solution_subgraph(path):
+	"""
+	Reads a solution written by write_solution_subgraph, and returns the subgraph (with attribute 'weight' on all
+	edges) and a dictionary of its summary fields.
+	"""
+	with open_instance_file(path, 'rb') as solution_file:
+		solution = json.load(solution_file)
+
+	subgraph = networkx.DiGraph()
+	for u, v, weight in solution.pop('edges'):
+		subgraph.add_edge(tuples_from_lists(u), tuples_from_lists(v), weight=weight)
+
+	return subgraph, solution
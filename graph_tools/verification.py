@@ -0,0 +1,52 @@
+"""
+This file implements verification of DCSN solutions.
+"""
+from graph_tools.feasibility import find_infeasible_demands
+
+
+def verify_DCSN_solution(graph, existence_for_node_condition, connectivity_demands, subgraph,
+						 existence_for_edge_condition=None):
+	"""
+	Given a DCSN instance:
+		- A directed graph with attribute 'weight' on all edges
+		- A dictionary from (node, condition) to existence {True, False}, or None if all nodes always exist
+		- A list of connectivity demands (source, target, condition)
+		- Optionally, a sparse dictionary from (u, v, condition) to existence {True, False}
+	and a candidate solution subgraph, returns:
+		- The list of demands (source, target, condition) with no source -> target path in the subgraph,
+		  restricted to nodes and edges active at the condition; a demand from a node to itself only needs the
+		  node to exist at the condition, not to be in the subgraph
+		- The objective, ie the total weight in graph of the subgraph's edges
+
+	Reachability is computed on the subgraph only, with one bitmask traversal per source covering all of its
+	conditions, so the running time is near-linear in the solution size times the number of conditions.
+
+	Raises a ValueError if the subgraph uses an edge that is not in the graph.
+	"""
+	for u, v in subgraph.edges_iter():
+		if not graph.has_edge(u, v):
+			raise ValueError('Solution edge %s -> %s is not in the graph' % (u, v))
+
+	def node_exists(node, condition):
+		return existence_for_node_condition is None or existence_for_node_condition.get((node, condition), 0)
+
+	violated_path_demands = set(find_infeasible_demands(
+		subgraph, existence_for_node_condition, [demand for demand in connectivity_demands if demand[0] != demand[1]],
+		existence_for_edge_condition))
+	violated_demands = [(source, target, condition) for source, target, condition in connectivity_demands
+						if (source, target, condition) in violated_path_demands or
+						(source == target and not node_exists(source, condition))]
+	objective = sum(graph[u][v]['weight'] for u, v in subgraph.edges_iter())
+
+	return violated_demands, objective
+
+
+def print_verification(violated_demands, objective):
+	print('Solution objective: %s' % objective)
+	if not violated_demands:
+		print('All demands are satisfied.')
+		return
+
+	print('Violated demands (source -> target at condition):')
+	for source, target, condition in violated_demands:
+		print('%s -> %s at condition %s' % (source, target, condition))
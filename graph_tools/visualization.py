@@ -1,12 +1,26 @@
 """
-This file implements algorithms for generating sample graphs.
+This file implements drawing of DCSN instances and solutions, and printing helpers.
 """
+import json
+import math
+import os
+import random
+
 import networkx
-import matplotlib.pyplot as pyplot
 import time, datetime
 
+from graph_tools.instance_io import tuples_from_lists
+
+# Solutions with more nodes than this are drawn without node labels by default
+LABEL_NODE_LIMIT = 100
+
+# Graphs with more nodes than this are laid out with sampled_spring_layout rather than networkx's spring layout
+SPRING_LAYOUT_NODE_LIMIT = 500
+
 
 def draw_DCSN_instance(graph, existence_for_node_conditions, connectivity_demands):
+	import matplotlib.pyplot as pyplot  # Only drawing interactively needs a display backend
+
 	# Assign non-terminals red, terminals green
 	color_for_node = {node : 'r' for node in graph.nodes()}
 	for source, target, condition in connectivity_demands:
@@ -28,6 +42,184 @@ def draw_DCSN_instance(graph, existence_for_node_conditions, connectivity_demand
 	pyplot.show()
 
 
+def sampled_spring_layout(graph, position_for_node, fixed_nodes=(), iterations=50, sample_size=100, seed=0):
+	"""
+	Given a graph and initial (x, y) positions of all its nodes, returns a dictionary from node to position after
+	Fruchterman-Reingold iterations that move every node not in fixed_nodes. Unlike networkx's spring layout, the
+	repulsion on each node is estimated from a random sample of sample_size nodes, and all forces are computed with
+	array operations, so each iteration takes time linear in the size of the graph.
+	"""
+	import numpy
+
+	nodes = graph.nodes()
+	if not nodes:
+		return {}
+	index_for_node = {node: index for index, node in enumerate(nodes)}
+	positions = numpy.array([position_for_node[node] for node in nodes], dtype=float)
+	edge_indices = numpy.array([(index_for_node[u], index_for_node[v]) for u, v in graph.edges_iter() if u != v],
+							   dtype=int).reshape(-1, 2)
+	movable = numpy.ones(len(nodes), dtype=bool)
+	movable[[index_for_node[node] for node in fixed_nodes]] = False
+
+	generator = numpy.random.RandomState(seed)
+	extent = max(numpy.ptp(positions, axis=0).max(), 1e-2)
+	k = extent / math.sqrt(len(nodes))  # Optimal distance between nodes
+	temperature = 0.1 * extent
+	sample_size = min(sample_size, len(nodes))
+
+	for iteration in xrange(iterations):
+		# Repulsion between every node and the sample, scaled up to all nodes
+		sample = positions[generator.choice(len(nodes), sample_size, replace=False)]
+		delta = positions[:, numpy.newaxis, :] - sample[numpy.newaxis, :, :]
+		distance_squared = numpy.maximum((delta ** 2).sum(axis=2), (1e-2 * k) ** 2)
+		displacement = (delta * (k ** 2 / distance_squared)[:, :, numpy.newaxis]).sum(axis=1) * (
+			len(nodes) / float(sample_size))
+
+		# Attraction along edges
+		delta = positions[edge_indices[:, 0]] - positions[edge_indices[:, 1]]
+		pull = delta * (numpy.sqrt((delta ** 2).sum(axis=1)) / k)[:, numpy.newaxis]
+		numpy.subtract.at(displacement, edge_indices[:, 0], pull)
+		numpy.add.at(displacement, edge_indices[:, 1], pull)
+
+		# Move by at most the temperature, which cools linearly
+		length = numpy.maximum(numpy.sqrt((displacement ** 2).sum(axis=1)), 1e-9)
+		step = displacement * (numpy.minimum(length, temperature) / length)[:, numpy.newaxis]
+		positions[movable] += step[movable]
+		temperature -= 0.1 * extent / (iterations + 1)
+
+	return {node: tuple(positions[index]) for index, node in enumerate(nodes)}
+
+
+class LayoutCache(object):
+	"""
+	Node positions shared by every render, so the same node is drawn at the same place across conditions and
+	solutions. Only nodes without a position yet are laid out, around the fixed positions of the others. If a path
+	is given, positions are loaded from it and save() writes them back, so separate processes reuse them too.
+	"""
+
+	def __init__(self, path=None, seed=0):
+		self.path = path
+		self.random = random.Random(seed)
+		self.position_for_node = {}
+		if path is not None and os.path.exists(path):
+			with open(path) as layout_file:
+				self.position_for_node = {tuples_from_lists(node): tuple(position)
+										  for node, position in json.load(layout_file)['positions']}
+
+	def positions(self, graph, iterations=50):
+		"""
+		Returns a dictionary from every node of the graph to its (x, y) position, computing a spring layout for the
+		nodes not seen before.
+		"""
+		new_nodes = [node for node in graph.nodes_iter() if node not in self.position_for_node]
+		if new_nodes:
+			fixed_nodes = [node for node in graph.nodes_iter() if node in self.position_for_node]
+			initial_position_for_node = {node: self.position_for_node.get(node) or
+										 (self.random.random(), self.random.random()) for node in graph.nodes_iter()}
+			if graph.number_of_nodes() <= SPRING_LAYOUT_NODE_LIMIT:
+				position_for_node = networkx.spring_layout(graph, pos=initial_position_for_node,
+														   fixed=fixed_nodes or None, iterations=iterations, weight=None)
+			else:
+				position_for_node = sampled_spring_layout(graph, initial_position_for_node, fixed_nodes, iterations,
+														  seed=self.random.randint(0, 2 ** 31))
+			for node in new_nodes:
+				self.position_for_node[node] = tuple(float(coordinate) for coordinate in position_for_node[node])
+
+		return {node: self.position_for_node[node] for node in graph.nodes_iter()}
+
+	def save(self):
+		with open(self.path + '.tmp', 'w') as layout_file:
+			json.dump({'positions': [[node, list(position)] for node, position in self.position_for_node.iteritems()]},
+					  layout_file)
+		os.rename(self.path + '.tmp', self.path)
+
+
+def render_DCSN_solution(path, subgraph, connectivity_demands, existence_for_node_condition=None,
+						 per_condition=False, layout_cache=None, with_labels=None, panel_size=6,
+						 existence_for_edge_condition=None):
+	"""
+	Given a solution subgraph of a DCSN instance and its connectivity demands (source, target, condition), draws the
+	subgraph and the demands' terminals (in green; other nodes in red) to an image file at path, whose format
+	follows its extension. Only the solution is laid out and drawn, never the whole input graph, and drawing goes
+	through matplotlib's file backend, so no display is needed.
+
+	If per_condition is set, each condition gets its own panel on a grid: edges active at the condition (according
+	to the existence dictionaries, where None means always active) are drawn dark, other solution edges faint, and
+	only that condition's terminals are green. Positions come from layout_cache (a LayoutCache), so they agree
+	across panels and repeated renders; pass the same cache to every call of a batch. Node labels are drawn if
+	with_labels is set, by default only for solutions of at most LABEL_NODE_LIMIT nodes.
+	"""
+	from matplotlib.backends.backend_agg import FigureCanvasAgg
+	from matplotlib.collections import LineCollection
+	from matplotlib.figure import Figure
+
+	# Draw the solution and every terminal, even if not in the solution (ie trivial or violated demands)
+	drawn_graph = networkx.DiGraph(subgraph.edges())
+	for source, target, condition in connectivity_demands:
+		drawn_graph.add_nodes_from([source, target])
+
+	layout_cache = layout_cache if layout_cache is not None else LayoutCache()
+	position_for_node = layout_cache.positions(drawn_graph)
+	if with_labels is None:
+		with_labels = drawn_graph.number_of_nodes() <= LABEL_NODE_LIMIT
+
+	def is_active(u, v, condition):
+		if condition is None:
+			return True
+		if existence_for_node_condition is not None and not (existence_for_node_condition.get((u, condition), 0) and
+															 existence_for_node_condition.get((v, condition), 0)):
+			return False
+		return existence_for_edge_condition is None or existence_for_edge_condition.get((u, v, condition), 0)
+
+	if per_condition:
+		conditions = sorted(set(condition for source, target, condition in connectivity_demands))
+	else:
+		conditions = [None]
+	column_count = int(math.ceil(math.sqrt(len(conditions))))
+	row_count = int(math.ceil(len(conditions) / float(column_count)))
+
+	figure = Figure(figsize=(panel_size * column_count, panel_size * row_count))
+	FigureCanvasAgg(figure)
+
+	for panel_index, condition in enumerate(conditions):
+		axes = figure.add_subplot(row_count, column_count, panel_index + 1)
+		axes.set_axis_off()
+		if condition is not None:
+			axes.set_title('Condition %s' % (condition,))
+
+		# Edges: one collection for faint (inactive) edges, and arrows for active ones
+		active_edges = [(u, v) for u, v in drawn_graph.edges_iter() if is_active(u, v, condition)]
+		inactive_edges = [(u, v) for u, v in drawn_graph.edges_iter() if not is_active(u, v, condition)]
+		if inactive_edges:
+			axes.add_collection(LineCollection([(position_for_node[u], position_for_node[v]) for u, v in inactive_edges],
+											   colors='0.85', linewidths=0.5, zorder=1))
+		if active_edges:
+			axes.quiver([position_for_node[u][0] for u, v in active_edges],
+						[position_for_node[u][1] for u, v in active_edges],
+						[position_for_node[v][0] - position_for_node[u][0] for u, v in active_edges],
+						[position_for_node[v][1] - position_for_node[u][1] for u, v in active_edges],
+						angles='xy', scale_units='xy', scale=1, width=0.002, headwidth=6, color='0.2', zorder=2)
+
+		# Nodes: terminals (at this condition) green, others red
+		terminals = set()
+		for source, target, demand_condition in connectivity_demands:
+			if condition is None or demand_condition == condition:
+				terminals.update([source, target])
+		nodes = drawn_graph.nodes()
+		axes.scatter([position_for_node[node][0] for node in nodes], [position_for_node[node][1] for node in nodes],
+					 c=['g' if node in terminals else 'r' for node in nodes],
+					 s=[40 if node in terminals else 15 for node in nodes], zorder=3)
+		if with_labels:
+			for node in nodes:
+				axes.annotate(str(node), position_for_node[node], fontsize=8, zorder=4)
+
+		axes.autoscale_view()
+
+	figure.savefig(path)
+	if layout_cache.path is not None:
+		layout_cache.save()
+
+
 def print_edges_in_graph(graph, edges_per_line=5):
 	edges_string = ''
 	edges_printed_in_line = 0